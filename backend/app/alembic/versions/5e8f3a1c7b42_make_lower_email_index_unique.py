@@ -0,0 +1,40 @@
+"""Make the lower(email) index unique
+
+Revision ID: 5e8f3a1c7b42
+Revises: 0d0d4114d473
+Create Date: 2026-10-17 18:42:09.513877
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8f3a1c7b42'
+down_revision = '0d0d4114d473'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Accounts whose emails differ only in case can't be merged
+    # automatically, they own prototypes and passwords of their own. Stop
+    # here and name them, so they can be resolved by hand before retrying.
+    duplicates = op.get_bind().execute(sa.text(
+        'SELECT lower(email), string_agg(email, \', \' ORDER BY email) '
+        'FROM "user" GROUP BY lower(email) HAVING count(*) > 1'
+    )).all()
+    if duplicates:
+        emails = '; '.join(row[1] for row in duplicates)
+        raise RuntimeError(
+            'Cannot make ix_user_email_lower unique, these accounts differ '
+            f'only in the case of their email: {emails}'
+        )
+    op.drop_index('ix_user_email_lower', table_name='user')
+    op.create_index('ix_user_email_lower', 'user', [sa.text('lower(email)')], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_user_email_lower', table_name='user')
+    op.create_index('ix_user_email_lower', 'user', [sa.text('lower(email)')], unique=False)
@@ -0,0 +1,47 @@
+"""Store prototype content as jsonb
+
+Revision ID: 782bcb489a9f
+Revises: 44fd475b5d9c
+Create Date: 2026-10-17 16:48:12.907135
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '782bcb489a9f'
+down_revision = '44fd475b5d9c'
+branch_labels = None
+depends_on = None
+
+CREATE_SEARCH_TRIGGER = """
+    CREATE TRIGGER prototype_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, description, content ON prototype
+    FOR EACH ROW EXECUTE FUNCTION prototype_search_vector_update()
+"""
+
+
+def upgrade():
+    # The type of a column listed in a trigger's UPDATE OF cannot be changed
+    op.execute('DROP TRIGGER prototype_search_vector_trigger ON prototype')
+    op.alter_column('prototype', 'content',
+               existing_type=sa.JSON(),
+               type_=postgresql.JSONB(astext_type=sa.Text()),
+               existing_nullable=False,
+               postgresql_using='content::jsonb')
+    op.execute(CREATE_SEARCH_TRIGGER)
+    op.create_index('ix_prototype_content', 'prototype', ['content'], unique=False, postgresql_using='gin', postgresql_ops={'content': 'jsonb_path_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_prototype_content', table_name='prototype', postgresql_using='gin', postgresql_ops={'content': 'jsonb_path_ops'})
+    op.execute('DROP TRIGGER prototype_search_vector_trigger ON prototype')
+    op.alter_column('prototype', 'content',
+               existing_type=postgresql.JSONB(astext_type=sa.Text()),
+               type_=sa.JSON(),
+               existing_nullable=False,
+               postgresql_using='content::json')
+    op.execute(CREATE_SEARCH_TRIGGER)
@@ -0,0 +1,86 @@
+"""Add prototype full text search
+
+Revision ID: 795f27834c14
+Revises: ee358df249a2
+Create Date: 2026-10-17 10:03:27.190442
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '795f27834c14'
+down_revision = 'ee358df249a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('prototype', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+
+    # Command names are the keys of content["commands"], subcommands nest the
+    # same structure under each command's own "commands" key
+    op.execute("""
+        CREATE OR REPLACE FUNCTION prototype_command_text(commands jsonb) RETURNS text AS $$
+        DECLARE
+            command record;
+            parts text[] := '{}';
+        BEGIN
+            IF commands IS NULL OR jsonb_typeof(commands) <> 'object' THEN
+                RETURN '';
+            END IF;
+            FOR command IN SELECT key, value FROM jsonb_each(commands) LOOP
+                parts := parts || command.key;
+                IF jsonb_typeof(command.value) = 'object' THEN
+                    parts := parts
+                        || coalesce(command.value ->> 'description', '')
+                        || coalesce(command.value ->> 'desc', '')
+                        || coalesce(command.value ->> 'describe', '');
+                    IF jsonb_typeof(command.value -> 'alias') = 'array' THEN
+                        parts := parts || ARRAY(
+                            SELECT jsonb_array_elements_text(command.value -> 'alias')
+                        );
+                    ELSE
+                        parts := parts || coalesce(command.value ->> 'alias', '');
+                    END IF;
+                    parts := parts || prototype_command_text(command.value -> 'commands');
+                END IF;
+            END LOOP;
+            RETURN array_to_string(parts, ' ');
+        END;
+        $$ LANGUAGE plpgsql IMMUTABLE
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION prototype_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector :=
+                setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A')
+                || setweight(to_tsvector('english', coalesce(NEW.description, '')), 'B')
+                || setweight(
+                    to_tsvector('english', prototype_command_text(NEW.content::jsonb -> 'commands')),
+                    'C'
+                );
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER prototype_search_vector_trigger
+        BEFORE INSERT OR UPDATE OF title, description, content ON prototype
+        FOR EACH ROW EXECUTE FUNCTION prototype_search_vector_update()
+    """)
+
+    # Backfill existing rows through the trigger
+    op.execute('UPDATE prototype SET title = title')
+    op.create_index('ix_prototype_search_vector', 'prototype', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_prototype_search_vector', table_name='prototype', postgresql_using='gin')
+    op.execute('DROP TRIGGER IF EXISTS prototype_search_vector_trigger ON prototype')
+    op.execute('DROP FUNCTION IF EXISTS prototype_search_vector_update()')
+    op.execute('DROP FUNCTION IF EXISTS prototype_command_text(jsonb)')
+    op.drop_column('prototype', 'search_vector')
@@ -1,17 +1,21 @@
-from collections.abc import Generator
+import uuid
+from collections.abc import AsyncGenerator, Generator
 from typing import Annotated
 
-import jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
 from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app import async_crud, crud
 from app.core import security
 from app.core.config import settings
-from app.core.db import engine
-from app.models import TokenPayload, User
+from app.core.db import async_engine, engine, replica_async_engine
+from app.models import TokenUser, User
+from app.utils import decode_cursor
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
@@ -19,26 +23,80 @@ reusable_oauth2 = OAuth2PasswordBearer(
 
 
 def get_db() -> Generator[Session, None, None]:
-    with Session(engine) as session:
+    # Objects written by the request are returned as they were flushed,
+    # instead of being reloaded with a SELECT after the commit
+    with Session(engine, expire_on_commit=False) as session:
+        yield session
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    # Likewise, and objects are read after commit outside of the greenlet,
+    # where expired attributes could not be reloaded
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
         yield session
 
 
 SessionDep = Annotated[Session, Depends(get_db)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-def get_current_user(session: SessionDep, token: TokenDep) -> User:
+def get_cursor(cursor: str | None = None) -> uuid.UUID | None:
+    if cursor is None:
+        return None
+    after = decode_cursor(cursor)
+    if after is None:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return after
+
+
+CursorDep = Annotated[uuid.UUID | None, Depends(get_cursor)]
+# Offset and page size of paginated routes, a limit of 0 or a negative one
+# never reaches the database and pages are at most PAGE_MAX_LIMIT rows
+SkipDep = Annotated[int, Query(ge=0)]
+LimitDep = Annotated[int, Query(ge=1, le=settings.PAGE_MAX_LIMIT)]
+
+
+async def get_current_token_user(
+    session: AsyncSessionDep, token: TokenDep
+) -> TokenUser:
+    """
+    Authorize from the claims of the access token alone. Tokens issued
+    without claims fall back to loading the user.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Could not validate credentials",
+    )
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
-        )
-        token_data = TokenPayload(**payload)
-    except (InvalidTokenError, ValidationError):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Could not validate credentials",
+        token_data = security.decode_token(token)
+        user_id = uuid.UUID(token_data.sub)
+    except (InvalidTokenError, ValidationError, TypeError, ValueError):
+        raise credentials_exception
+    if token_data.type == "refresh":
+        raise credentials_exception
+
+    if token_data.is_active is not None and token_data.is_superuser is not None:
+        token_user = TokenUser(
+            id=user_id,
+            is_active=token_data.is_active,
+            is_superuser=token_data.is_superuser,
         )
-    user = session.get(User, token_data.sub)
+    else:
+        user = await async_crud.get_user_for_auth(session=session, user_id=user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        token_user = TokenUser.model_validate(user, from_attributes=True)
+    if not token_user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return token_user
+
+
+CurrentTokenUser = Annotated[TokenUser, Depends(get_current_token_user)]
+
+
+def get_current_user(session: SessionDep, token_user: CurrentTokenUser) -> User:
+    user = crud.get_user_for_auth(session=session, user_id=token_user.id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.is_active:
@@ -49,7 +107,60 @@ def get_current_user(session: SessionDep, token: TokenDep) -> User:
 CurrentUser = Annotated[User, Depends(get_current_user)]
 
 
-def get_current_active_superuser(current_user: CurrentUser) -> User:
+# Set on responses to writes, while present the client's reads use the
+# primary
+STICKY_PRIMARY_COOKIE = "read_from_primary"
+
+
+def stick_to_primary(response: Response) -> None:
+    """
+    Route the client's reads to the primary for a while, so a write is visible
+    to its author even while the replica lags behind.
+    """
+    response.set_cookie(
+        STICKY_PRIMARY_COOKIE,
+        "1",
+        max_age=settings.REPLICA_STICKY_SECONDS,
+        path=settings.API_V1_STR,
+        secure=settings.ENVIRONMENT != "local",
+        httponly=True,
+        samesite="lax",
+    )
+
+
+def _read_engine(*, primary: bool = False) -> AsyncEngine:
+    if primary or replica_async_engine is None:
+        return async_engine
+    return replica_async_engine
+
+
+def _read_session(*, primary: bool = False) -> AsyncSession:
+    bind = _read_engine(primary=primary)
+    # crud doesn't cache decisions read from a lagging replica
+    return AsyncSession(
+        bind,
+        expire_on_commit=False,
+        info={"replica": bind is not async_engine},
+    )
+
+
+async def get_read_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    primary = STICKY_PRIMARY_COOKIE in request.cookies
+    async with _read_session(primary=primary) as session:
+        yield session
+
+
+async def get_public_read_db() -> AsyncGenerator[AsyncSession, None]:
+    async with _read_session() as session:
+        yield session
+
+
+# Sessions for read-only routes, on the replica if one is configured
+ReadSessionDep = Annotated[AsyncSession, Depends(get_read_db)]
+PublicReadSessionDep = Annotated[AsyncSession, Depends(get_public_read_db)]
+
+
+def get_current_active_superuser(current_user: CurrentTokenUser) -> TokenUser:
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=403, detail="The user doesn't have enough privileges"
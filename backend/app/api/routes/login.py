@@ -1,16 +1,26 @@
+import math
+import uuid
 from datetime import timedelta
 from typing import Annotated, Any
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import HTMLResponse
 from fastapi.security import OAuth2PasswordRequestForm
+from jwt.exceptions import InvalidTokenError
+from pydantic import ValidationError
 
 from app import crud
-from app.api.deps import CurrentUser, SessionDep, get_current_active_superuser
+from app.api.deps import (
+    CurrentUser,
+    SessionDep,
+    get_current_active_superuser,
+    stick_to_primary,
+)
 from app.core import security
 from app.core.config import settings
 from app.core.security import get_password_hash
-from app.models import Message, NewPassword, Token, UserPublic
+from app.core.throttle import login_throttle
+from app.models import Message, NewPassword, Token, TokenRefresh, User, UserPublic
 from app.utils import (
     generate_password_reset_token,
     generate_reset_password_email,
@@ -23,23 +33,72 @@ router = APIRouter()
 
 @router.post("/login/access-token")
 def login_access_token(
-    session: SessionDep, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+    request: Request,
+    session: SessionDep,
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
 ) -> Token:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
-    user = crud.authenticate(
-        session=session, email=form_data.username, password=form_data.password
-    )
+    # The proxy's address unless uvicorn trusts its forwarded headers, see
+    # LOGIN_THROTTLE_PER_IP
+    ip = request.client.host if request.client else "unknown"
+    retry_after = login_throttle.acquire(ip=ip, email=form_data.username)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many failed login attempts, try again later",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+    try:
+        user = crud.authenticate(
+            session=session, email=form_data.username, password=form_data.password
+        )
+    except Exception:
+        login_throttle.release(ip=ip, email=form_data.username)
+        raise
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
+    login_throttle.release(ip=ip, email=form_data.username)
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return create_tokens(user)
+
+
+@router.post("/login/refresh-token")
+def refresh_token(session: SessionDep, body: TokenRefresh) -> Token:
+    """
+    Exchange a refresh token for a new access token and refresh token
+    """
+    try:
+        token_data = security.decode_token(body.refresh_token)
+        user_id = uuid.UUID(token_data.sub)
+    except (InvalidTokenError, ValidationError, TypeError, ValueError):
+        raise HTTPException(status_code=403, detail="Could not validate credentials")
+    if token_data.type != "refresh":
+        raise HTTPException(status_code=403, detail="Could not validate credentials")
+    # The only place claims are refreshed from the database, skip the cache
+    user = crud.get_user_by_id(session=session, user_id=user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
+    return create_tokens(user)
+
+
+def create_tokens(user: User) -> Token:
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    refresh_token_expires = timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES)
     return Token(
         access_token=security.create_access_token(
-            user.id, expires_delta=access_token_expires
-        )
+            user.id,
+            expires_delta=access_token_expires,
+            is_active=user.is_active,
+            is_superuser=user.is_superuser,
+        ),
+        refresh_token=security.create_refresh_token(
+            user.id, expires_delta=refresh_token_expires
+        ),
     )
 
 
@@ -75,7 +134,7 @@ def recover_password(email: str, session: SessionDep) -> Message:
     return Message(message="Password recovery email sent")
 
 
-@router.post("/reset-password/")
+@router.post("/reset-password/", dependencies=[Depends(stick_to_primary)])
 def reset_password(session: SessionDep, body: NewPassword) -> Message:
     """
     Reset password
@@ -95,6 +154,7 @@ def reset_password(session: SessionDep, body: NewPassword) -> Message:
     user.hashed_password = hashed_password
     session.add(user)
     session.commit()
+    crud.invalidate_user(user.id)
     return Message(message="Password updated successfully")
 
 
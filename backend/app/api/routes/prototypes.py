@@ -1,48 +1,86 @@
 import uuid
 from typing import Any
 
-from fastapi import APIRouter, HTTPException
-
-from app import crud
-from app.api.deps import CurrentUser, SessionDep
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app import async_crud, crud
+from app.api.deps import (
+    AsyncSessionDep,
+    CurrentTokenUser,
+    CursorDep,
+    LimitDep,
+    PublicReadSessionDep,
+    ReadSessionDep,
+    SkipDep,
+    stick_to_primary,
+)
+from app.core.config import settings
 from app.models import (
     CollaboratorAdd,
     CollaboratorInfo,
     CollaboratorsPublic,
     CollaboratorUpdate,
     Message,
+    PrototypeAccessRole,
+    PrototypeBatchGet,
+    PrototypeContentQuery,
     PrototypeCreate,
+    PrototypeImportReport,
+    PrototypeImportResult,
     PrototypePublic,
+    PrototypesBatchPublic,
     PrototypesPublic,
+    PrototypeSummariesPublic,
     PrototypeUpdate,
 )
+from app.utils import encode_cursor, iter_lines, validation_error_message
 
 router = APIRouter()
 
 
+@router.get("/public/", response_model=PrototypeSummariesPublic)
+async def read_public_prototypes(
+    session: PublicReadSessionDep, after: CursorDep, limit: LimitDep = 100
+) -> Any:
+    """
+    Browse the public prototype catalog. No authentication required.
+
+    Returns summaries without content, paginated with `cursor`/`next_cursor`.
+    """
+    return await async_crud.get_public_prototypes(
+        session=session, limit=limit, after=after
+    )
+
+
 @router.get("/public/check/{prototype_id}")
-def check_prototype_public(
-    *, session: SessionDep, prototype_id: uuid.UUID
+async def check_prototype_public(
+    *, session: PublicReadSessionDep, prototype_id: uuid.UUID
 ) -> dict[str, bool]:
     """
     Check if a prototype is public. This endpoint doesn't require authentication.
     """
-    prototype = crud.get_prototype(session=session, prototype_id=prototype_id)
+    prototype = await async_crud.get_prototype(
+        session=session, prototype_id=prototype_id
+    )
     if not prototype:
         raise HTTPException(status_code=404, detail="Prototype not found")
     return {"is_public": prototype.visibility == "public"}
 
 
 @router.get("/public/{prototype_id}", response_model=PrototypePublic)
-def read_public_prototype(
+async def read_public_prototype(
     *,
-    session: SessionDep,
+    session: PublicReadSessionDep,
     prototype_id: uuid.UUID,
 ) -> Any:
     """
     Get public prototype by ID. No authentication required.
     """
-    prototype = crud.get_prototype(session=session, prototype_id=prototype_id)
+    prototype = await async_crud.get_prototype(
+        session=session, prototype_id=prototype_id
+    )
     if not prototype:
         raise HTTPException(status_code=404, detail="Prototype not found")
 
@@ -53,116 +91,330 @@ def read_public_prototype(
 
 
 @router.get("/", response_model=PrototypesPublic)
-def read_prototypes(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+async def read_prototypes(
+    session: ReadSessionDep,
+    current_user: CurrentTokenUser,
+    after: CursorDep,
+    skip: SkipDep = 0,
+    limit: LimitDep = 100,
 ) -> Any:
     """
     Retrieve prototypes. Returns public prototypes and user's own prototypes.
+
+    Pass the `next_cursor` of a page as `cursor` to fetch the following page
+    with keyset pagination, `skip` is ignored in that case.
     """
-    user_prototypes = crud.get_user_prototypes(session=session, user_id=current_user.id)
-    start = skip
-    end = skip + limit
-    paginated_prototypes = user_prototypes[start:end]
-    return PrototypesPublic(data=paginated_prototypes, count=len(user_prototypes))
+    prototypes, count = await async_crud.get_user_prototypes(
+        session=session, user_id=current_user.id, skip=skip, limit=limit, after=after
+    )
+    next_cursor = encode_cursor(prototypes[-1].id) if len(prototypes) == limit else None
+    return PrototypesPublic(data=prototypes, count=count, next_cursor=next_cursor)
 
 
-@router.post("/", response_model=PrototypePublic)
-def create_prototype(
-    *, session: SessionDep, current_user: CurrentUser, prototype_in: PrototypeCreate
+@router.get("/summaries", response_model=PrototypeSummariesPublic)
+async def read_prototype_summaries(
+    session: ReadSessionDep,
+    current_user: CurrentTokenUser,
+    after: CursorDep,
+    skip: SkipDep = 0,
+    limit: LimitDep = 100,
+) -> Any:
+    """
+    Retrieve prototypes without their content, for list views.
+
+    Paginated like the full prototype list, the content column is never
+    loaded from the database.
+    """
+    prototypes, count = await async_crud.get_user_prototypes(
+        session=session,
+        user_id=current_user.id,
+        skip=skip,
+        limit=limit,
+        after=after,
+        with_content=False,
+    )
+    next_cursor = encode_cursor(prototypes[-1].id) if len(prototypes) == limit else None
+    return PrototypeSummariesPublic(
+        data=prototypes, count=count, next_cursor=next_cursor
+    )
+
+
+@router.get("/search", response_model=PrototypeSummariesPublic)
+async def search_prototypes(
+    session: ReadSessionDep,
+    current_user: CurrentTokenUser,
+    q: str,
+    skip: SkipDep = 0,
+    limit: LimitDep = 100,
+) -> Any:
+    """
+    Full-text search over titles, descriptions and CLI command names, aliases
+    and descriptions of the prototypes the user can access, best match first.
+    """
+    prototypes, count = await async_crud.search_prototypes(
+        session=session, user_id=current_user.id, query=q, skip=skip, limit=limit
+    )
+    return PrototypeSummariesPublic(data=prototypes, count=count)
+
+
+@router.post("/search/content", response_model=PrototypeSummariesPublic)
+async def search_prototype_content(
+    *,
+    session: ReadSessionDep,
+    current_user: CurrentTokenUser,
+    query_in: PrototypeContentQuery,
+    skip: SkipDep = 0,
+    limit: LimitDep = 100,
+) -> Any:
+    """
+    Find the prototypes the user can access by their content, with JSON
+    containment and/or a SQL/JSON path expression. For example
+    `{"contains": {"commands": {"deploy": {}}}}` matches prototypes defining
+    a top-level `deploy` command and `{"path": "$.**.commands.deploy"}` ones
+    defining it at any depth.
+    """
+    try:
+        prototypes, count = await async_crud.search_prototype_content(
+            session=session,
+            user_id=current_user.id,
+            contains=query_in.contains,
+            path=query_in.path,
+            skip=skip,
+            limit=limit,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON path")
+    return PrototypeSummariesPublic(data=prototypes, count=count)
+
+
+@router.post("/batch-get", response_model=PrototypesBatchPublic)
+async def batch_get_prototypes(
+    *,
+    session: ReadSessionDep,
+    current_user: CurrentTokenUser,
+    batch_in: PrototypeBatchGet,
+) -> Any:
+    """
+    Get several prototypes by ID with a single access check.
+    """
+    if len(batch_in.ids) > settings.PROTOTYPE_BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.PROTOTYPE_BATCH_MAX_IDS} IDs can be requested",
+        )
+    prototypes, denied = await async_crud.get_prototypes_by_ids(
+        session=session, prototype_ids=batch_in.ids, user_id=current_user.id
+    )
+    return PrototypesBatchPublic(data=prototypes, denied=denied)
+
+
+@router.post(
+    "/", response_model=PrototypePublic, dependencies=[Depends(stick_to_primary)]
+)
+async def create_prototype(
+    *,
+    session: AsyncSessionDep,
+    current_user: CurrentTokenUser,
+    prototype_in: PrototypeCreate,
 ) -> Any:
     """
     Create new prototype.
     """
-    prototype = crud.create_prototype(
+    prototype = await async_crud.create_prototype(
         session=session, prototype_in=prototype_in, owner_id=current_user.id
     )
     return prototype
 
 
+@router.post(
+    "/import",
+    response_model=PrototypeImportReport,
+    dependencies=[Depends(stick_to_primary)],
+)
+async def import_prototypes(
+    *, session: AsyncSessionDep, current_user: CurrentTokenUser, request: Request
+) -> Any:
+    """
+    Create prototypes owned by the current user from an NDJSON body, one
+    `PrototypeCreate` object per line.
+
+    The body is read as it streams in and valid lines are inserted in batches,
+    so lines or batches that fail do not prevent the others from being
+    created. The report has a result for every non-blank line.
+    """
+    media_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if media_type != "application/x-ndjson":
+        raise HTTPException(status_code=415, detail="Send application/x-ndjson")
+
+    results: list[PrototypeImportResult] = []
+    batch: list[tuple[int, PrototypeCreate]] = []
+
+    async def flush() -> None:
+        lines = [line for line, _ in batch]
+        prototypes_in = [prototype_in for _, prototype_in in batch]
+        batch.clear()
+        try:
+            ids = await async_crud.create_prototypes(
+                session=session, prototypes_in=prototypes_in, owner_id=current_user.id
+            )
+        except (DataError, IntegrityError):
+            # Earlier batches stay committed, report this one as failed
+            await session.rollback()
+            results.extend(
+                PrototypeImportResult(
+                    line=line,
+                    error="A value in this batch was rejected by the database",
+                )
+                for line in lines
+            )
+            return
+        results.extend(
+            PrototypeImportResult(line=line, id=id)
+            for line, id in zip(lines, ids, strict=True)
+        )
+
+    line_number = 0
+    async for line in iter_lines(
+        request.stream(), max_line_bytes=settings.PROTOTYPE_IMPORT_MAX_LINE_BYTES
+    ):
+        line_number += 1
+        if line is None:
+            results.append(
+                PrototypeImportResult(line=line_number, error="Line too long")
+            )
+            continue
+        if not line.strip():
+            continue
+        try:
+            prototype_in = PrototypeCreate.model_validate_json(line)
+        except ValidationError as exc:
+            results.append(
+                PrototypeImportResult(
+                    line=line_number, error=validation_error_message(exc)
+                )
+            )
+            continue
+        batch.append((line_number, prototype_in))
+        if len(batch) >= settings.PROTOTYPE_IMPORT_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+
+    results.sort(key=lambda result: result.line)
+    created = sum(result.id is not None for result in results)
+    return PrototypeImportReport(
+        created=created, failed=len(results) - created, results=results
+    )
+
+
 @router.get("/{prototype_id}", response_model=PrototypePublic)
-def read_prototype(
+async def read_prototype(
     *,
-    session: SessionDep,
+    session: ReadSessionDep,
     prototype_id: uuid.UUID,
-    current_user: CurrentUser,
+    current_user: CurrentTokenUser,
 ) -> Any:
     """
     Get prototype by ID. Requires authentication and proper access permissions.
     """
-    prototype = crud.get_prototype(session=session, prototype_id=prototype_id)
-    if not prototype or not crud.can_access_prototype(
-        session=session, user_id=current_user.id, prototype_id=prototype_id
-    ):
+    prototype, role = await async_crud.get_prototype_with_role(
+        session=session, prototype_id=prototype_id, user_id=current_user.id
+    )
+    if not prototype or role not in crud.VIEW_ROLES:
         raise HTTPException(status_code=403, detail="Access denied")
 
     return prototype
 
 
-@router.put("/{prototype_id}", response_model=PrototypePublic)
-def update_prototype(
+@router.put(
+    "/{prototype_id}",
+    response_model=PrototypePublic,
+    dependencies=[Depends(stick_to_primary)],
+)
+async def update_prototype(
     *,
-    session: SessionDep,
-    current_user: CurrentUser,
+    session: AsyncSessionDep,
+    current_user: CurrentTokenUser,
     prototype_id: uuid.UUID,
     prototype_in: PrototypeUpdate,
 ) -> Any:
     """
     Update a prototype.
     """
-    prototype = crud.get_prototype(session=session, prototype_id=prototype_id)
-    if not prototype or not crud.can_edit_prototype(
-        session=session, user_id=current_user.id, prototype_id=prototype_id
-    ):
+    prototype, role = await async_crud.get_prototype_with_role(
+        session=session, prototype_id=prototype_id, user_id=current_user.id
+    )
+    if not prototype or role not in crud.EDIT_ROLES:
         raise HTTPException(status_code=403, detail="Access denied")
 
-    update_dict = prototype_in.model_dump(exclude_unset=True)
-    prototype.sqlmodel_update(update_dict)
-    session.add(prototype)
-    session.commit()
-    session.refresh(prototype)
+    prototype = await async_crud.update_prototype(
+        session=session, db_prototype=prototype, prototype_in=prototype_in
+    )
     return prototype
 
 
-@router.delete("/{prototype_id}")
-def delete_prototype(
-    *, session: SessionDep, current_user: CurrentUser, prototype_id: uuid.UUID
+@router.delete("/{prototype_id}", dependencies=[Depends(stick_to_primary)])
+async def delete_prototype(
+    *, session: AsyncSessionDep, current_user: CurrentTokenUser, prototype_id: uuid.UUID
 ) -> Message:
     """
     Delete a prototype. Only owner can delete.
     """
-    prototype = crud.get_prototype(session=session, prototype_id=prototype_id)
-    if not prototype or prototype.owner_id != current_user.id:
+    prototype, role = await async_crud.get_prototype_with_role(
+        session=session,
+        prototype_id=prototype_id,
+        user_id=current_user.id,
+        with_content=False,
+    )
+    if not prototype or role != PrototypeAccessRole.OWNER:
         raise HTTPException(status_code=403, detail="Access denied")
 
-    session.delete(prototype)
-    session.commit()
+    await async_crud.delete_prototype(session=session, db_prototype=prototype)
     return Message(message="Prototype deleted successfully")
 
 
 @router.get("/{prototype_id}/collaborators", response_model=CollaboratorsPublic)
-def read_collaborators(
-    *, session: SessionDep, current_user: CurrentUser, prototype_id: uuid.UUID
+async def read_collaborators(
+    *,
+    session: ReadSessionDep,
+    current_user: CurrentTokenUser,
+    prototype_id: uuid.UUID,
+    skip: SkipDep = 0,
+    limit: LimitDep = 100,
+    after: CursorDep,
 ) -> Any:
     """
-    Get all collaborators for a prototype.
+    Get collaborators for a prototype.
+
+    Pass the `next_cursor` of a page as `cursor` to fetch the following page
+    with keyset pagination, `skip` is ignored in that case.
     """
-    prototype = crud.get_prototype(session=session, prototype_id=prototype_id)
-    if not prototype or not crud.can_access_prototype(
-        session=session, user_id=current_user.id, prototype_id=prototype_id
-    ):
+    role = await async_crud.get_prototype_role(
+        session=session, prototype_id=prototype_id, user_id=current_user.id
+    )
+    if role not in crud.VIEW_ROLES:
         raise HTTPException(status_code=403, detail="Access denied")
 
-    collaborators = crud.get_prototype_collaborators(
-        session=session, prototype_id=prototype_id
+    collaborators, count = await async_crud.get_prototype_collaborators(
+        session=session, prototype_id=prototype_id, skip=skip, limit=limit, after=after
     )
-    return CollaboratorsPublic(data=collaborators, count=len(collaborators))
+    next_cursor = (
+        encode_cursor(collaborators[-1].user_id)
+        if len(collaborators) == limit
+        else None
+    )
+    return CollaboratorsPublic(data=collaborators, count=count, next_cursor=next_cursor)
 
 
-@router.post("/{prototype_id}/collaborators/{user_id}", response_model=CollaboratorInfo)
-def add_collaborator(
+@router.post(
+    "/{prototype_id}/collaborators/{user_id}",
+    response_model=CollaboratorInfo,
+    dependencies=[Depends(stick_to_primary)],
+)
+async def add_collaborator(
     *,
-    session: SessionDep,
-    current_user: CurrentUser,
+    session: AsyncSessionDep,
+    current_user: CurrentTokenUser,
     prototype_id: uuid.UUID,
     user_id: uuid.UUID,
     collaborator_in: CollaboratorAdd,
@@ -170,22 +422,23 @@ def add_collaborator(
     """
     Add a collaborator to a prototype using their user ID.
     """
-    prototype = crud.get_prototype(session=session, prototype_id=prototype_id)
-    if not prototype or prototype.owner_id != current_user.id:
+    role = await async_crud.get_prototype_role(
+        session=session, prototype_id=prototype_id, user_id=current_user.id
+    )
+    if role != PrototypeAccessRole.OWNER:
         raise HTTPException(status_code=403, detail="Access denied")
 
     # Check if collaborator already exists
-    existing_collaborators = crud.get_prototype_collaborators(
-        session=session, prototype_id=prototype_id
-    )
-    if any(collaborator.user_id == user_id for collaborator in existing_collaborators):
+    if await async_crud.is_prototype_collaborator(
+        session=session, prototype_id=prototype_id, user_id=user_id
+    ):
         raise HTTPException(
             status_code=400,
             detail="User is already a collaborator for this prototype",
         )
 
     try:
-        collaborator = crud.add_collaborator(
+        collaborator = await async_crud.add_collaborator(
             session=session,
             prototype_id=prototype_id,
             user_id=user_id,
@@ -197,11 +450,15 @@ def add_collaborator(
     return collaborator
 
 
-@router.put("/{prototype_id}/collaborators/{user_id}", response_model=CollaboratorInfo)
-def update_collaborator(
+@router.put(
+    "/{prototype_id}/collaborators/{user_id}",
+    response_model=CollaboratorInfo,
+    dependencies=[Depends(stick_to_primary)],
+)
+async def update_collaborator(
     *,
-    session: SessionDep,
-    current_user: CurrentUser,
+    session: AsyncSessionDep,
+    current_user: CurrentTokenUser,
     prototype_id: uuid.UUID,
     user_id: uuid.UUID,
     collaborator_in: CollaboratorUpdate,
@@ -209,12 +466,14 @@ def update_collaborator(
     """
     Update a collaborator's role. Only owner can update roles.
     """
-    prototype = crud.get_prototype(session=session, prototype_id=prototype_id)
-    if not prototype or prototype.owner_id != current_user.id:
+    role = await async_crud.get_prototype_role(
+        session=session, prototype_id=prototype_id, user_id=current_user.id
+    )
+    if role != PrototypeAccessRole.OWNER:
         raise HTTPException(status_code=403, detail="Access denied")
 
     try:
-        collaborator = crud.update_collaborator_role(
+        collaborator = await async_crud.update_collaborator_role(
             session=session,
             prototype_id=prototype_id,
             user_id=user_id,
@@ -226,23 +485,27 @@ def update_collaborator(
     return collaborator
 
 
-@router.delete("/{prototype_id}/collaborators/{user_id}")
-def remove_collaborator(
+@router.delete(
+    "/{prototype_id}/collaborators/{user_id}", dependencies=[Depends(stick_to_primary)]
+)
+async def remove_collaborator(
     *,
-    session: SessionDep,
-    current_user: CurrentUser,
+    session: AsyncSessionDep,
+    current_user: CurrentTokenUser,
     prototype_id: uuid.UUID,
     user_id: uuid.UUID,
 ) -> Message:
     """
     Remove a collaborator from a prototype using their user ID. Only owner can remove collaborators.
     """
-    prototype = crud.get_prototype(session=session, prototype_id=prototype_id)
-    if not prototype or prototype.owner_id != current_user.id:
+    role = await async_crud.get_prototype_role(
+        session=session, prototype_id=prototype_id, user_id=current_user.id
+    )
+    if role != PrototypeAccessRole.OWNER:
         raise HTTPException(status_code=403, detail="Access denied")
 
     try:
-        crud.remove_collaborator(
+        await async_crud.remove_collaborator(
             session=session,
             prototype_id=prototype_id,
             user_id=user_id,
@@ -1,30 +1,51 @@
+import csv
 import uuid
+from collections.abc import AsyncIterator
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import col, delete, func, select
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy.exc import DataError, IntegrityError
 
-from app import crud
+from app import async_crud, crud
 from app.api.deps import (
+    AsyncSessionDep,
+    CurrentTokenUser,
     CurrentUser,
+    CursorDep,
+    LimitDep,
+    ReadSessionDep,
     SessionDep,
+    SkipDep,
     get_current_active_superuser,
+    stick_to_primary,
 )
 from app.core.config import settings
-from app.core.security import get_password_hash, verify_password
+from app.core.security import (
+    PasswordHashingBusyError,
+    get_password_hash,
+    verify_password,
+)
 from app.models import (
     Message,
-    Prototype,
     UpdatePassword,
     User,
     UserCreate,
+    UserImportReport,
+    UserImportResult,
     UserPublic,
     UserRegister,
     UsersPublic,
     UserUpdate,
     UserUpdateMe,
 )
-from app.utils import generate_new_account_email, send_email
+from app.utils import (
+    encode_cursor,
+    generate_new_account_email,
+    iter_lines,
+    send_email,
+    validation_error_message,
+)
 
 router = APIRouter()
 
@@ -34,22 +55,33 @@ router = APIRouter()
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UsersPublic,
 )
-def read_users(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+async def read_users(
+    session: ReadSessionDep,
+    after: CursorDep,
+    skip: SkipDep = 0,
+    limit: LimitDep = 100,
+) -> Any:
     """
     Retrieve users.
-    """
-
-    count_statement = select(func.count()).select_from(User)
-    count = session.exec(count_statement).one()
 
-    statement = select(User).offset(skip).limit(limit)
-    users = session.exec(statement).all()
+    Pass the `next_cursor` of a page as `cursor` to fetch the following page
+    with keyset pagination, `skip` is ignored in that case.
+    """
+    users, count = await async_crud.get_users(
+        session=session, skip=skip, limit=limit, after=after
+    )
 
-    return UsersPublic(data=users, count=count)
+    next_cursor = encode_cursor(users[-1].id) if len(users) == limit else None
+    return UsersPublic(data=users, count=count, next_cursor=next_cursor)
 
 
 @router.post(
-    "/", dependencies=[Depends(get_current_active_superuser)], response_model=UserPublic
+    "/",
+    dependencies=[
+        Depends(get_current_active_superuser),
+        Depends(stick_to_primary),
+    ],
+    response_model=UserPublic,
 )
 def create_user(*, session: SessionDep, user_in: UserCreate) -> Any:
     """
@@ -64,18 +96,183 @@ def create_user(*, session: SessionDep, user_in: UserCreate) -> Any:
 
     user = crud.create_user(session=session, user_create=user_in)
     if settings.emails_enabled and user_in.email:
-        email_data = generate_new_account_email(
-            email_to=user_in.email, username=user_in.email, password=user_in.password
+        _send_new_account_email(user_in)
+    return user
+
+
+def _send_new_account_email(user_in: UserCreate) -> None:
+    email_data = generate_new_account_email(
+        email_to=user_in.email, username=user_in.email, password=user_in.password
+    )
+    send_email(
+        email_to=user_in.email,
+        subject=email_data.subject,
+        html_content=email_data.html_content,
+    )
+
+
+async def _parse_import_lines(
+    request: Request, *, is_csv: bool
+) -> AsyncIterator[tuple[int, UserCreate | str]]:
+    """
+    Yield the number of the first line of each non-blank record of an import
+    body with the user it describes or the reason it was rejected. The first
+    record of a CSV body is its header, CSV records span several lines when
+    a quoted field contains newlines.
+    """
+    max_bytes = settings.USER_IMPORT_MAX_LINE_BYTES
+    header: list[str] | None = None
+    record = bytearray()
+    record_line = line_number = 0
+    async for line in iter_lines(request.stream(), max_line_bytes=max_bytes):
+        line_number += 1
+        if line is None or len(record) + len(line) > max_bytes:
+            yield record_line if record else line_number, "Line too long"
+            record.clear()
+            continue
+        line = line.rstrip(b"\r")
+        if record:
+            record += b"\n" + line
+        elif line.strip():
+            record += line
+            record_line = line_number
+        else:
+            continue
+        # An odd number of quotes leaves a quoted field open
+        if is_csv and record.count(b'"') % 2:
+            continue
+        data = bytes(record)
+        record.clear()
+        result: UserCreate | str
+        try:
+            if not is_csv:
+                result = UserCreate.model_validate_json(data)
+            else:
+                row = next(csv.reader([data.decode()]))
+                if header is None:
+                    header = [name.strip() for name in row]
+                    continue
+                result = UserCreate.model_validate(
+                    {
+                        name: value
+                        for name, value in zip(header, row, strict=False)
+                        if value
+                    }
+                )
+        except UnicodeDecodeError:
+            result = "Invalid UTF-8"
+        except ValidationError as exc:
+            result = validation_error_message(exc)
+        yield record_line, result
+    if record:
+        yield record_line, "Unterminated quoted field"
+
+
+@router.post(
+    "/import",
+    dependencies=[
+        Depends(get_current_active_superuser),
+        Depends(stick_to_primary),
+    ],
+    response_model=UserImportReport,
+)
+async def import_users(
+    *,
+    session: AsyncSessionDep,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    send_welcome_emails: bool = False,
+) -> Any:
+    """
+    Create users from a `text/csv` body with a header row or an
+    `application/x-ndjson` body, one `UserCreate` object per line.
+
+    The body is read as it streams in and processed in batches: one query
+    finds the emails already taken, passwords are hashed across the bulk
+    hashing pool's workers and the new users are inserted together. Lines
+    or batches that fail do not prevent the others from being created, the
+    report has a result for every non-blank data record. With
+    `send_welcome_emails`, the new account emails are sent after the
+    response.
+    """
+    media_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if media_type not in ("text/csv", "application/x-ndjson"):
+        raise HTTPException(
+            status_code=415, detail="Send text/csv or application/x-ndjson"
+        )
+
+    results: list[UserImportResult] = []
+    seen_emails: set[str] = set()
+    batch: list[tuple[int, UserCreate]] = []
+
+    async def flush() -> None:
+        existing = await async_crud.get_existing_emails(
+            session=session, emails=[user_in.email for _, user_in in batch]
         )
-        send_email(
-            email_to=user_in.email,
-            subject=email_data.subject,
-            html_content=email_data.html_content,
+        new = []
+        for line, user_in in batch:
+            if user_in.email.lower() in existing:
+                results.append(
+                    UserImportResult(
+                        line=line,
+                        error="The user with this email already exists in the system.",
+                    )
+                )
+            else:
+                new.append((line, user_in))
+        batch.clear()
+        try:
+            ids = await async_crud.create_users(
+                session=session, users_in=[user_in for _, user_in in new]
+            )
+        except (IntegrityError, DataError, PasswordHashingBusyError) as exc:
+            # Earlier batches stay committed, report this one as failed
+            await session.rollback()
+            if isinstance(exc, IntegrityError):
+                error = "An email in this batch was taken during the import"
+            elif isinstance(exc, DataError):
+                error = "A value in this batch was rejected by the database"
+            else:
+                error = "Too many password operations, try again shortly"
+            results.extend(UserImportResult(line=line, error=error) for line, _ in new)
+            return
+        results.extend(
+            UserImportResult(line=line, id=id)
+            for (line, _), id in zip(new, ids, strict=True)
         )
-    return user
+        if send_welcome_emails and settings.emails_enabled:
+            for _, user_in in new:
+                background_tasks.add_task(_send_new_account_email, user_in)
+
+    async for line, result in _parse_import_lines(
+        request, is_csv=media_type == "text/csv"
+    ):
+        if isinstance(result, str):
+            results.append(UserImportResult(line=line, error=result))
+            continue
+        email = result.email.lower()
+        if email in seen_emails:
+            results.append(
+                UserImportResult(line=line, error="Duplicate email in this import")
+            )
+            continue
+        seen_emails.add(email)
+        batch.append((line, result))
+        if len(batch) >= settings.USER_IMPORT_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+
+    results.sort(key=lambda result: result.line)
+    created = sum(result.id is not None for result in results)
+    return UserImportReport(
+        created=created, failed=len(results) - created, results=results
+    )
 
 
-@router.patch("/me", response_model=UserPublic)
+@router.patch(
+    "/me", response_model=UserPublic, dependencies=[Depends(stick_to_primary)]
+)
 def update_user_me(
     *, session: SessionDep, user_in: UserUpdateMe, current_user: CurrentUser
 ) -> Any:
@@ -93,17 +290,21 @@ def update_user_me(
     current_user.sqlmodel_update(user_data)
     session.add(current_user)
     session.commit()
-    session.refresh(current_user)
+    crud.invalidate_user(current_user.id)
     return current_user
 
 
-@router.patch("/me/password", response_model=Message)
+@router.patch(
+    "/me/password", response_model=Message, dependencies=[Depends(stick_to_primary)]
+)
 def update_password_me(
     *, session: SessionDep, body: UpdatePassword, current_user: CurrentUser
 ) -> Any:
     """
     Update own password.
     """
+    # Verify against the current hash on the primary, never a cached one
+    session.refresh(current_user, attribute_names=["hashed_password"])
     if not verify_password(body.current_password, current_user.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect password")
     if body.current_password == body.new_password:
@@ -114,6 +315,7 @@ def update_password_me(
     current_user.hashed_password = hashed_password
     session.add(current_user)
     session.commit()
+    crud.invalidate_user(current_user.id)
     return Message(message="Password updated successfully")
 
 
@@ -125,8 +327,8 @@ def read_user_me(current_user: CurrentUser) -> Any:
     return current_user
 
 
-@router.delete("/me", response_model=Message)
-def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
+@router.delete("/me", response_model=Message, dependencies=[Depends(stick_to_primary)])
+def delete_user_me(session: SessionDep, current_user: CurrentTokenUser) -> Any:
     """
     Delete own user.
     """
@@ -134,14 +336,15 @@ def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
-    statement = delete(Prototype).where(col(Prototype.owner_id) == current_user.id)
-    session.exec(statement)  # type: ignore
-    session.delete(current_user)
-    session.commit()
+    # A token's claims outlive the user they were issued for
+    if not crud.delete_user(session=session, user_id=current_user.id):
+        raise HTTPException(status_code=404, detail="User not found")
     return Message(message="User deleted successfully")
 
 
-@router.post("/signup", response_model=UserPublic)
+@router.post(
+    "/signup", response_model=UserPublic, dependencies=[Depends(stick_to_primary)]
+)
 def register_user(session: SessionDep, user_in: UserRegister) -> Any:
     """
     Create new user without the need to be logged in.
@@ -158,14 +361,14 @@ def register_user(session: SessionDep, user_in: UserRegister) -> Any:
 
 
 @router.get("/{user_id}", response_model=UserPublic)
-def read_user_by_id(
-    user_id: uuid.UUID, session: SessionDep, current_user: CurrentUser
+async def read_user_by_id(
+    user_id: uuid.UUID, session: ReadSessionDep, current_user: CurrentTokenUser
 ) -> Any:
     """
     Get a specific user by id.
     """
-    user = session.get(User, user_id)
-    if user == current_user:
+    user = await session.get(User, user_id)
+    if user and user.id == current_user.id:
         return user
     if not current_user.is_superuser:
         raise HTTPException(
@@ -177,7 +380,10 @@ def read_user_by_id(
 
 @router.patch(
     "/{user_id}",
-    dependencies=[Depends(get_current_active_superuser)],
+    dependencies=[
+        Depends(get_current_active_superuser),
+        Depends(stick_to_primary),
+    ],
     response_model=UserPublic,
 )
 def update_user(
@@ -207,22 +413,23 @@ def update_user(
     return db_user
 
 
-@router.delete("/{user_id}", dependencies=[Depends(get_current_active_superuser)])
+@router.delete(
+    "/{user_id}",
+    dependencies=[
+        Depends(get_current_active_superuser),
+        Depends(stick_to_primary),
+    ],
+)
 def delete_user(
-    session: SessionDep, current_user: CurrentUser, user_id: uuid.UUID
+    session: SessionDep, current_user: CurrentTokenUser, user_id: uuid.UUID
 ) -> Message:
     """
     Delete a user.
     """
-    user = session.get(User, user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    if user == current_user:
+    if user_id == current_user.id:
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
-    statement = delete(Prototype).where(col(Prototype.owner_id) == user_id)
-    session.exec(statement)  # type: ignore
-    session.delete(user)
-    session.commit()
+    if not crud.delete_user(session=session, user_id=user_id):
+        raise HTTPException(status_code=404, detail="User not found")
     return Message(message="User deleted successfully")
@@ -1,7 +1,10 @@
+from typing import Any
+
 from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
 from app.api.deps import get_current_active_superuser
+from app.core import metrics
 from app.models import Message
 from app.utils import generate_test_email, send_email
 
@@ -26,6 +29,14 @@ def test_email(email_to: EmailStr) -> Message:
     return Message(message="Test email sent")
 
 
+@router.get("/metrics/", dependencies=[Depends(get_current_active_superuser)])
+def read_metrics() -> dict[str, Any]:
+    """
+    In-process counters of the worker serving the request.
+    """
+    return metrics.collect()
+
+
 @router.get("/health-check/")
 async def health_check() -> bool:
     return True
@@ -0,0 +1,362 @@
+"""
+Async variants of the `crud` functions used by async routes.
+
+Each one runs the sync implementation on the AsyncSession's connection with
+`run_sync`, so queries and cache invalidation stay defined in one place.
+Queries that belong together, like a page and its total count, run in turn
+on that same connection.
+"""
+
+import uuid
+from collections.abc import Callable, Collection, Sequence
+from typing import Any, TypeVar, cast
+
+import anyio
+from sqlalchemy import orm
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud
+from app.core.security import get_password_hashes
+from app.models import (
+    CollaboratorInfo,
+    CollaboratorRole,
+    Prototype,
+    PrototypeAccessRole,
+    PrototypeCreate,
+    PrototypeSummariesPublic,
+    PrototypeUpdate,
+    User,
+    UserCreate,
+)
+
+T = TypeVar("T")
+
+
+async def run_sync(session: AsyncSession, call: Callable[[Session], T]) -> T:
+    """
+    `session.run_sync` typed for crud, AsyncSession hands the call sqlmodel's
+    Session although its signature promises SQLAlchemy's.
+    """
+    return await session.run_sync(cast(Callable[[orm.Session], T], call))
+
+
+async def run_all(session: AsyncSession, *calls: Callable[[Session], Any]) -> list[Any]:
+    """
+    Run the calls one after the other on `session`, with a single switch to
+    the sync side. A request holds one connection however many queries it
+    needs, rather than waiting for more while holding its own.
+    """
+    return await run_sync(session, lambda s: [call(s) for call in calls])
+
+
+async def get_user_for_auth(
+    *, session: AsyncSession, user_id: uuid.UUID
+) -> User | None:
+    return await run_sync(
+        session, lambda s: crud.get_user_for_auth(session=s, user_id=user_id)
+    )
+
+
+async def get_users(
+    *,
+    session: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    after: uuid.UUID | None = None,
+) -> tuple[list[User], int]:
+    users, count = await run_all(
+        session,
+        lambda s: crud.list_users(session=s, skip=skip, limit=limit, after=after),
+        lambda s: crud.count_users(session=s),
+    )
+    return users, count
+
+
+async def get_existing_emails(
+    *, session: AsyncSession, emails: Collection[str]
+) -> set[str]:
+    return await run_sync(
+        session, lambda s: crud.get_existing_emails(session=s, emails=emails)
+    )
+
+
+async def create_users(
+    *, session: AsyncSession, users_in: Sequence[UserCreate]
+) -> list[uuid.UUID]:
+    # Hash in a worker thread, waiting on the hashing pool inside run_sync
+    # would block the event loop
+    hashed_passwords = await anyio.to_thread.run_sync(
+        get_password_hashes, [user_in.password for user_in in users_in]
+    )
+    return await run_sync(
+        session,
+        lambda s: crud.create_users(
+            session=s, users_in=users_in, hashed_passwords=hashed_passwords
+        ),
+    )
+
+
+async def create_prototype(
+    *, session: AsyncSession, prototype_in: PrototypeCreate, owner_id: uuid.UUID
+) -> Prototype:
+    return await run_sync(
+        session,
+        lambda s: crud.create_prototype(
+            session=s, prototype_in=prototype_in, owner_id=owner_id
+        ),
+    )
+
+
+async def create_prototypes(
+    *,
+    session: AsyncSession,
+    prototypes_in: Collection[PrototypeCreate],
+    owner_id: uuid.UUID,
+) -> list[uuid.UUID]:
+    return await run_sync(
+        session,
+        lambda s: crud.create_prototypes(
+            session=s, prototypes_in=prototypes_in, owner_id=owner_id
+        ),
+    )
+
+
+async def update_prototype(
+    *, session: AsyncSession, db_prototype: Prototype, prototype_in: PrototypeUpdate
+) -> Prototype:
+    return await run_sync(
+        session,
+        lambda s: crud.update_prototype(
+            session=s, db_prototype=db_prototype, prototype_in=prototype_in
+        ),
+    )
+
+
+async def delete_prototype(*, session: AsyncSession, db_prototype: Prototype) -> None:
+    await run_sync(
+        session, lambda s: crud.delete_prototype(session=s, db_prototype=db_prototype)
+    )
+
+
+async def get_prototype(
+    *, session: AsyncSession, prototype_id: uuid.UUID
+) -> Prototype | None:
+    return await run_sync(
+        session, lambda s: crud.get_prototype(session=s, prototype_id=prototype_id)
+    )
+
+
+async def get_prototype_with_role(
+    *,
+    session: AsyncSession,
+    prototype_id: uuid.UUID,
+    user_id: uuid.UUID,
+    with_content: bool = True,
+) -> tuple[Prototype | None, PrototypeAccessRole]:
+    return await run_sync(
+        session,
+        lambda s: crud.get_prototype_with_role(
+            session=s,
+            prototype_id=prototype_id,
+            user_id=user_id,
+            with_content=with_content,
+        ),
+    )
+
+
+async def get_prototype_role(
+    *, session: AsyncSession, prototype_id: uuid.UUID, user_id: uuid.UUID
+) -> PrototypeAccessRole:
+    # Cache hits need no connection at all
+    role = crud.acl_cache.get((user_id, prototype_id))
+    if role is not None:
+        return role
+    return await run_sync(
+        session,
+        lambda s: crud.get_prototype_role(
+            session=s, prototype_id=prototype_id, user_id=user_id
+        ),
+    )
+
+
+async def get_prototypes_by_ids(
+    *, session: AsyncSession, prototype_ids: Collection[uuid.UUID], user_id: uuid.UUID
+) -> tuple[list[Prototype], list[uuid.UUID]]:
+    return await run_sync(
+        session,
+        lambda s: crud.get_prototypes_by_ids(
+            session=s, prototype_ids=prototype_ids, user_id=user_id
+        ),
+    )
+
+
+async def get_user_prototypes(
+    *,
+    session: AsyncSession,
+    user_id: uuid.UUID,
+    skip: int = 0,
+    limit: int = 100,
+    after: uuid.UUID | None = None,
+    with_content: bool = True,
+) -> tuple[list[Prototype], int]:
+    # Offset pages come with a window count in a single statement already
+    if after is None:
+        return await run_sync(
+            session,
+            lambda s: crud.get_user_prototypes(
+                session=s,
+                user_id=user_id,
+                skip=skip,
+                limit=limit,
+                with_content=with_content,
+            ),
+        )
+
+    prototypes, count = await run_all(
+        session,
+        lambda s: crud.get_user_prototypes_after(
+            session=s,
+            user_id=user_id,
+            after=after,
+            limit=limit,
+            with_content=with_content,
+        ),
+        lambda s: crud.count_user_prototypes(session=s, user_id=user_id),
+    )
+    return prototypes, count
+
+
+async def get_public_prototypes(
+    *, session: AsyncSession, limit: int = 100, after: uuid.UUID | None = None
+) -> PrototypeSummariesPublic:
+    page_size = crud.public_catalog_page_size(limit)
+    catalog = crud.public_catalog_cache.get((after, page_size))
+    if catalog is None:
+        generation = crud.public_catalog_cache.generation
+        prototypes, count = await run_all(
+            session,
+            lambda s: crud.get_public_prototypes_page(
+                session=s, limit=page_size, after=after
+            ),
+            lambda s: crud.count_public_prototypes(session=s),
+        )
+        catalog = crud.cache_public_catalog(
+            session=session.sync_session,
+            prototypes=prototypes,
+            count=count,
+            page_size=page_size,
+            after=after,
+            generation=generation,
+        )
+    return crud.limit_public_catalog(catalog, limit)
+
+
+async def search_prototypes(
+    *,
+    session: AsyncSession,
+    user_id: uuid.UUID,
+    query: str,
+    skip: int = 0,
+    limit: int = 100,
+) -> tuple[list[Prototype], int]:
+    return await run_sync(
+        session,
+        lambda s: crud.search_prototypes(
+            session=s, user_id=user_id, query=query, skip=skip, limit=limit
+        ),
+    )
+
+
+async def search_prototype_content(
+    *,
+    session: AsyncSession,
+    user_id: uuid.UUID,
+    contains: dict[str, Any] | None = None,
+    path: str | None = None,
+    skip: int = 0,
+    limit: int = 100,
+) -> tuple[list[Prototype], int]:
+    return await run_sync(
+        session,
+        lambda s: crud.search_prototype_content(
+            session=s,
+            user_id=user_id,
+            contains=contains,
+            path=path,
+            skip=skip,
+            limit=limit,
+        ),
+    )
+
+
+async def add_collaborator(
+    *,
+    session: AsyncSession,
+    prototype_id: uuid.UUID,
+    user_id: uuid.UUID,
+    role: CollaboratorRole,
+) -> CollaboratorInfo:
+    return await run_sync(
+        session,
+        lambda s: crud.add_collaborator(
+            session=s, prototype_id=prototype_id, user_id=user_id, role=role
+        ),
+    )
+
+
+async def update_collaborator_role(
+    *,
+    session: AsyncSession,
+    prototype_id: uuid.UUID,
+    user_id: uuid.UUID,
+    new_role: CollaboratorRole,
+) -> CollaboratorInfo:
+    return await run_sync(
+        session,
+        lambda s: crud.update_collaborator_role(
+            session=s, prototype_id=prototype_id, user_id=user_id, new_role=new_role
+        ),
+    )
+
+
+async def remove_collaborator(
+    *, session: AsyncSession, prototype_id: uuid.UUID, user_id: uuid.UUID
+) -> None:
+    await run_sync(
+        session,
+        lambda s: crud.remove_collaborator(
+            session=s, prototype_id=prototype_id, user_id=user_id
+        ),
+    )
+
+
+async def is_prototype_collaborator(
+    *, session: AsyncSession, prototype_id: uuid.UUID, user_id: uuid.UUID
+) -> bool:
+    return await run_sync(
+        session,
+        lambda s: crud.is_prototype_collaborator(
+            session=s, prototype_id=prototype_id, user_id=user_id
+        ),
+    )
+
+
+async def get_prototype_collaborators(
+    *,
+    session: AsyncSession,
+    prototype_id: uuid.UUID,
+    skip: int = 0,
+    limit: int | None = None,
+    after: uuid.UUID | None = None,
+) -> tuple[list[CollaboratorInfo], int]:
+    collaborators, count = await run_all(
+        session,
+        lambda s: crud.list_prototype_collaborators(
+            session=s, prototype_id=prototype_id, skip=skip, limit=limit, after=after
+        ),
+        lambda s: crud.count_prototype_collaborators(
+            session=s, prototype_id=prototype_id
+        ),
+    )
+    return collaborators, count
@@ -0,0 +1,110 @@
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+
+import anyio
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import async_crud, crud
+from app.core.config import settings
+from app.core.db import async_engine, engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Starlette runs sync endpoints on anyio's default thread limiter
+THREADPOOL_SIZE = 40
+
+
+def list_sync(user_id: uuid.UUID, after: uuid.UUID, limit: int) -> None:
+    with Session(engine) as session:
+        crud.get_user_prototypes(
+            session=session, user_id=user_id, after=after, limit=limit
+        )
+
+
+async def list_async(user_id: uuid.UUID, after: uuid.UUID, limit: int) -> None:
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        await async_crud.get_user_prototypes(
+            session=session, user_id=user_id, after=after, limit=limit
+        )
+
+
+async def run(
+    name: str,
+    request: Callable[[], Awaitable[None]],
+    requests: int,
+    concurrency: int,
+) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async def timed() -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await request()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(timed() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    logger.info(
+        f"{name}: {requests / elapsed:.0f} requests/s, "
+        f"mean {statistics.mean(latencies) * 1000:.1f} ms, "
+        f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f} ms"
+    )
+
+
+async def main_async(
+    email: str, requests: int, concurrencies: list[int], limit: int
+) -> None:
+    with Session(engine) as session:
+        user = crud.get_user_by_email(session=session, email=email)
+    if not user:
+        raise SystemExit(f"User {email} not found")
+    # Keyset pages take the path with a separate count query, run after the
+    # page on the same connection
+    after = uuid.UUID(int=0)
+    limiter = anyio.CapacityLimiter(THREADPOOL_SIZE)
+
+    async def sync_request() -> None:
+        await anyio.to_thread.run_sync(
+            list_sync, user.id, after, limit, limiter=limiter
+        )
+
+    async def async_request() -> None:
+        await list_async(user.id, after, limit)
+
+    # Warm up both connection pools
+    await run("warm-up", sync_request, THREADPOOL_SIZE, THREADPOOL_SIZE)
+    await run("warm-up", async_request, THREADPOOL_SIZE, THREADPOOL_SIZE)
+    for concurrency in concurrencies:
+        await run(f"sync  c={concurrency}", sync_request, requests, concurrency)
+        await run(f"async c={concurrency}", async_request, requests, concurrency)
+    await async_engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare the throughput of the sync crud path, run in a "
+        "threadpool like sync routes, with the async crud path when listing a "
+        "user's prototypes at increasing concurrency."
+    )
+    parser.add_argument("--email", default=settings.FIRST_SUPERUSER)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument(
+        "--concurrency", type=int, nargs="*", default=[10, 50, 200, 500]
+    )
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.email, args.requests, args.concurrency, args.limit))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+from passlib.context import CryptContext
+
+from app.core.config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PASSWORD = "correct horse battery staple"
+
+
+def _hash(options: dict[str, Any]) -> float:
+    context = CryptContext(**options)
+    start = time.perf_counter()
+    context.hash(PASSWORD)
+    return time.perf_counter() - start
+
+
+def measure(
+    name: str, options: dict[str, Any], iterations: int, processes: int
+) -> None:
+    _hash(options)  # load the backend outside of the measurement
+    latencies = sorted(_hash(options) for _ in range(iterations))
+
+    with ProcessPoolExecutor(
+        max_workers=processes, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        list(executor.map(_hash, [options] * processes))
+        start = time.perf_counter()
+        list(executor.map(_hash, [options] * iterations * processes))
+        elapsed = time.perf_counter() - start
+
+    logger.info(
+        f"{name}: mean {statistics.mean(latencies) * 1000:.1f} ms, "
+        f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+        f"max {latencies[-1] * 1000:.1f} ms per hash, "
+        f"{iterations / sum(latencies):.1f} hashes/s on one core, "
+        f"{iterations * processes / elapsed:.1f} hashes/s with {processes} processes"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Measure password hashing latency and throughput on this "
+        "machine for a range of cost factors."
+    )
+    parser.add_argument(
+        "--bcrypt-rounds",
+        type=int,
+        nargs="*",
+        default=[settings.PASSWORD_BCRYPT_ROUNDS],
+        help="bcrypt cost factors to measure",
+    )
+    parser.add_argument(
+        "--argon2",
+        action="store_true",
+        help="also measure argon2id with the configured parameters, "
+        "requires the argon2 extra",
+    )
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=settings.PASSWORD_HASH_WORKERS or os.cpu_count() or 1,
+        help="worker processes for the throughput measurement",
+    )
+    args = parser.parse_args()
+
+    for rounds in args.bcrypt_rounds:
+        measure(
+            f"bcrypt rounds={rounds}",
+            {"schemes": ["bcrypt"], "bcrypt__rounds": rounds},
+            args.iterations,
+            args.processes,
+        )
+    if args.argon2:
+        measure(
+            f"argon2id time_cost={settings.PASSWORD_ARGON2_TIME_COST} "
+            f"memory_cost={settings.PASSWORD_ARGON2_MEMORY_COST} "
+            f"parallelism={settings.PASSWORD_ARGON2_PARALLELISM}",
+            {
+                "schemes": ["argon2"],
+                "argon2__type": "id",
+                "argon2__time_cost": settings.PASSWORD_ARGON2_TIME_COST,
+                "argon2__memory_cost": settings.PASSWORD_ARGON2_MEMORY_COST,
+                "argon2__parallelism": settings.PASSWORD_ARGON2_PARALLELISM,
+            },
+            args.iterations,
+            args.processes,
+        )
+
+
+if __name__ == "__main__":
+    main()
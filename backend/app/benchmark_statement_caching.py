@@ -0,0 +1,133 @@
+import argparse
+import logging
+import time
+import uuid
+from collections.abc import Callable
+from typing import Any
+
+from sqlmodel import Session, col, create_engine, exists, func, select
+
+from app import crud
+from app.core.config import settings
+from app.models import Prototype, PrototypeCollaborator, User
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+Lookup = Callable[[Session, User, uuid.UUID], Any]
+
+
+# The lookups as they were written before crud prebuilt their statements,
+# building a new select() on every call
+
+
+def select_user_by_email(session: Session, user: User, _: uuid.UUID) -> Any:
+    statement = select(User).where(func.lower(User.email) == func.lower(user.email))
+    return session.exec(statement).first()
+
+
+def select_user_by_id(session: Session, user: User, _: uuid.UUID) -> Any:
+    return session.exec(select(User).where(User.id == user.id)).first()
+
+
+def select_prototype(session: Session, _: User, prototype_id: uuid.UUID) -> Any:
+    return session.exec(select(Prototype).where(Prototype.id == prototype_id)).first()
+
+
+def select_is_collaborator(
+    session: Session, user: User, prototype_id: uuid.UUID
+) -> Any:
+    statement = select(
+        exists().where(
+            col(PrototypeCollaborator.prototype_id) == prototype_id,
+            col(PrototypeCollaborator.user_id) == user.id,
+        )
+    )
+    return session.exec(statement).one()
+
+
+LOOKUPS: dict[str, tuple[Lookup, Lookup]] = {
+    "get_user_by_email": (
+        select_user_by_email,
+        lambda s, user, _: crud.get_user_by_email(session=s, email=user.email),
+    ),
+    "get_user_by_id": (
+        select_user_by_id,
+        lambda s, user, _: crud.get_user_by_id(session=s, user_id=user.id),
+    ),
+    "get_prototype": (
+        select_prototype,
+        lambda s, _, prototype_id: crud.get_prototype(
+            session=s, prototype_id=prototype_id
+        ),
+    ),
+    "is_prototype_collaborator": (
+        select_is_collaborator,
+        lambda s, user, prototype_id: crud.is_prototype_collaborator(
+            session=s, prototype_id=prototype_id, user_id=user.id
+        ),
+    ),
+}
+
+
+def measure(
+    lookup: Lookup,
+    session: Session,
+    user: User,
+    prototype_id: uuid.UUID,
+    iterations: int,
+) -> float:
+    # Warm up the compiled cache and let psycopg prepare the query
+    for _ in range(10):
+        lookup(session, user, prototype_id)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        lookup(session, user, prototype_id)
+    return (time.perf_counter() - start) / iterations
+
+
+def parse_threshold(value: str) -> int | None:
+    return None if value.lower() == "none" else int(value)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare the per-call time of the hot crud lookups built as "
+        "a new select() on every call with their prebuilt statements, for a "
+        "range of psycopg prepare thresholds."
+    )
+    parser.add_argument("--email", default=settings.FIRST_SUPERUSER)
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument(
+        "--prepare-threshold",
+        type=parse_threshold,
+        nargs="*",
+        default=[settings.DB_PREPARE_THRESHOLD],
+        help='executions before psycopg prepares a query, "none" to never prepare',
+    )
+    args = parser.parse_args()
+
+    for threshold in args.prepare_threshold:
+        engine = create_engine(
+            str(settings.SQLALCHEMY_DATABASE_URI),
+            connect_args={"prepare_threshold": threshold},
+        )
+        with Session(engine) as session:
+            user = crud.get_user_by_email(session=session, email=args.email)
+            if not user:
+                raise SystemExit(f"User {args.email} not found")
+            prototype = session.exec(select(Prototype)).first()
+            prototype_id = prototype.id if prototype else uuid.uuid4()
+            for name, (built, cached) in LOOKUPS.items():
+                before = measure(built, session, user, prototype_id, args.iterations)
+                after = measure(cached, session, user, prototype_id, args.iterations)
+                logger.info(
+                    f"{name} prepare_threshold={threshold}: "
+                    f"select() {before * 1e6:.0f} us, "
+                    f"prebuilt {after * 1e6:.0f} us per call"
+                )
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -32,8 +32,11 @@ class Settings(BaseSettings):
     )
     API_V1_STR: str = "/api/v1"
     SECRET_KEY: str = secrets.token_urlsafe(32)
+    # Access tokens carry the user's is_active and is_superuser claims, so a
+    # change to either takes effect within this many minutes
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
     # 60 minutes * 24 hours * 8 days = 8 days
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
+    REFRESH_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
     FRONTEND_HOST: str = "http://localhost:5173"
     ENVIRONMENT: Literal["local", "staging", "production"] = "local"
 
@@ -56,6 +59,37 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str = ""
     POSTGRES_DB: str = ""
 
+    # Optional streaming replica, same credentials and database as the
+    # primary. Read-only routes use it when set.
+    POSTGRES_REPLICA_SERVER: str | None = None
+    POSTGRES_REPLICA_PORT: int | None = None
+    # A client's reads go to the primary for this long after any write it
+    # made, to hide replication lag from editors. Tracked with a cookie so it
+    # holds whichever worker serves the next request.
+    REPLICA_STICKY_SECONDS: int = 10
+
+    # Per worker process, the sync engine opens up to DB_POOL_SIZE +
+    # DB_MAX_OVERFLOW connections to the primary and the async engine up to
+    # ASYNC_DB_POOL_SIZE + ASYNC_DB_MAX_OVERFLOW more. Keep the sum times the
+    # number of workers below Postgres' max_connections (100 by default).
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    # Async requests hold a connection only while their queries run
+    ASYNC_DB_POOL_SIZE: int = 2
+    ASYNC_DB_MAX_OVERFLOW: int = 3
+    DB_POOL_TIMEOUT: float = 30
+    # Seconds after which a connection is replaced, -1 to keep them forever
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # psycopg prepares a query on the server once it ran this many times on a
+    # connection, None never prepares
+    DB_PREPARE_THRESHOLD: int | None = 5
+    # Disable server-side prepared statements when connecting through
+    # PgBouncer in transaction pooling mode, overrides DB_PREPARE_THRESHOLD
+    DB_PGBOUNCER: bool = False
+    # Compiled SQL strings kept per engine
+    DB_QUERY_CACHE_SIZE: int = 500
+
     @computed_field  # type: ignore[prop-decorator]
     @property
     def SQLALCHEMY_DATABASE_URI(self) -> PostgresDsn:
@@ -68,6 +102,79 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def SQLALCHEMY_REPLICA_DATABASE_URI(self) -> PostgresDsn | None:
+        if not self.POSTGRES_REPLICA_SERVER:
+            return None
+        return MultiHostUrl.build(
+            scheme="postgresql+psycopg",
+            username=self.POSTGRES_USER,
+            password=self.POSTGRES_PASSWORD,
+            host=self.POSTGRES_REPLICA_SERVER,
+            port=self.POSTGRES_REPLICA_PORT or self.POSTGRES_PORT,
+            path=self.POSTGRES_DB,
+        )
+
+    # Anonymous public catalog pages are cached per worker for this long
+    PUBLIC_CATALOG_CACHE_TTL_SECONDS: int = 30
+    PUBLIC_CATALOG_CACHE_MAX_SIZE: int = 256
+    # Per-worker (user, prototype) role decisions, other workers see access
+    # changes after at most this TTL
+    ACL_CACHE_TTL_SECONDS: int = 60
+    ACL_CACHE_MAX_SIZE: int = 10_000
+    # Per-worker users resolved from access tokens, deactivation made through
+    # another worker takes effect after at most this TTL
+    USER_CACHE_TTL_SECONDS: int = 30
+    USER_CACHE_MAX_SIZE: int = 10_000
+    # Per-worker verified access tokens, entries expire with the token or
+    # after this TTL, whichever comes first
+    TOKEN_CACHE_TTL_SECONDS: int = 300
+    TOKEN_CACHE_MAX_SIZE: int = 10_000
+    # Upper bound on the `limit` of paginated routes
+    PAGE_MAX_LIMIT: int = 500
+    # Upper bound on the number of IDs accepted by POST /prototypes/batch-get
+    PROTOTYPE_BATCH_MAX_IDS: int = 100
+    # POST /prototypes/import inserts this many prototypes per transaction
+    # and rejects NDJSON lines longer than the max without buffering them
+    PROTOTYPE_IMPORT_BATCH_SIZE: int = 1000
+    PROTOTYPE_IMPORT_MAX_LINE_BYTES: int = 1024 * 1024
+    # POST /users/import checks, hashes and inserts this many users at a time
+    USER_IMPORT_BATCH_SIZE: int = 500
+    USER_IMPORT_MAX_LINE_BYTES: int = 64 * 1024
+
+    # New passwords use the first scheme, existing hashes using the others or
+    # different cost factors are rehashed on the next successful login.
+    # "argon2" (argon2id) requires the argon2 extra.
+    PASSWORD_HASH_SCHEMES: list[Literal["bcrypt", "argon2"]] = ["bcrypt"]
+    PASSWORD_BCRYPT_ROUNDS: int = 12
+    PASSWORD_ARGON2_TIME_COST: int = 3
+    PASSWORD_ARGON2_MEMORY_COST: int = 65536  # KiB
+    PASSWORD_ARGON2_PARALLELISM: int = 4
+    # Failed logins allowed per account, and per client IP if enabled, as a
+    # burst capacity refilled at a steady rate. "database" shares the buckets
+    # between workers, "memory" keeps them per worker.
+    LOGIN_THROTTLE_BACKEND: Literal["memory", "database"] = "memory"
+    # Only enable behind a proxy once uvicorn trusts its X-Forwarded-For
+    # (FORWARDED_ALLOW_IPS), otherwise every client has the proxy's address
+    # and shares a single bucket
+    LOGIN_THROTTLE_PER_IP: bool = False
+    LOGIN_THROTTLE_IP_CAPACITY: int = 20
+    LOGIN_THROTTLE_IP_PER_MINUTE: float = 10
+    LOGIN_THROTTLE_ACCOUNT_CAPACITY: int = 5
+    LOGIN_THROTTLE_ACCOUNT_PER_MINUTE: float = 1
+    LOGIN_THROTTLE_MEMORY_MAX_KEYS: int = 100_000
+
+    # Worker processes for password hashing, 0 hashes inline in the request
+    # thread. Requests beyond workers + max pending get a 503.
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 16
+    # Separate worker processes for bulk hashing like user imports, so their
+    # batches never queue ahead of logins. A batch takes a single slot of
+    # workers + max pending.
+    PASSWORD_HASH_BULK_WORKERS: int = 2
+    PASSWORD_HASH_BULK_MAX_PENDING: int = 0
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
@@ -1,10 +1,71 @@
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlmodel import Session, create_engine, select
 
 from app import crud
+from app.core import metrics
 from app.core.config import settings
+from app.core.pool import TimedAsyncAdaptedQueuePool, TimedQueuePool
 from app.models import User, UserCreate
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+
+def engine_options(*, pool_size: int, max_overflow: int) -> dict[str, Any]:
+    options: dict[str, Any] = {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "query_cache_size": settings.DB_QUERY_CACHE_SIZE,
+        "connect_args": {"prepare_threshold": settings.DB_PREPARE_THRESHOLD},
+    }
+    if settings.DB_PGBOUNCER:
+        # PgBouncer in transaction mode hands each transaction to any server
+        # connection, where psycopg's prepared statements may not exist
+        options["connect_args"] = {"prepare_threshold": None}
+    return options
+
+
+engine = create_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    poolclass=TimedQueuePool,
+    **engine_options(
+        pool_size=settings.DB_POOL_SIZE, max_overflow=settings.DB_MAX_OVERFLOW
+    ),
+)
+# Same database through psycopg's async driver, for async routes
+async_engine = create_async_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    poolclass=TimedAsyncAdaptedQueuePool,
+    **engine_options(
+        pool_size=settings.ASYNC_DB_POOL_SIZE,
+        max_overflow=settings.ASYNC_DB_MAX_OVERFLOW,
+    ),
+)
+# Read-only routes use the replica when one is configured
+replica_async_engine: AsyncEngine | None = None
+if settings.SQLALCHEMY_REPLICA_DATABASE_URI:
+    replica_async_engine = create_async_engine(
+        str(settings.SQLALCHEMY_REPLICA_DATABASE_URI),
+        poolclass=TimedAsyncAdaptedQueuePool,
+        **engine_options(
+            pool_size=settings.ASYNC_DB_POOL_SIZE,
+            max_overflow=settings.ASYNC_DB_MAX_OVERFLOW,
+        ),
+    )
+
+# engine.pool is replaced on dispose, look it up on every collection
+metrics.register("db_pool", lambda: engine.pool.stats())  # type: ignore[attr-defined]
+metrics.register(
+    "db_async_pool",
+    lambda: async_engine.sync_engine.pool.stats(),  # type: ignore[attr-defined]
+)
+if replica_async_engine is not None:
+    metrics.register(
+        "db_replica_pool",
+        lambda: replica_async_engine.sync_engine.pool.stats(),  # type: ignore
+    )
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
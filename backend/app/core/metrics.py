@@ -0,0 +1,16 @@
+from collections.abc import Callable
+from typing import Any
+
+_collectors: dict[str, Callable[[], dict[str, Any]]] = {}
+
+
+def register(name: str, collector: Callable[[], dict[str, Any]]) -> None:
+    """
+    Register a callable returning the current counters of a component, they
+    are reported under `name` by the metrics endpoint.
+    """
+    _collectors[name] = collector
+
+
+def collect() -> dict[str, dict[str, Any]]:
+    return {name: collector() for name, collector in _collectors.items()}
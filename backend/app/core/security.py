@@ -1,27 +1,246 @@
+import hashlib
+import multiprocessing
+import threading
+import time
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
-from typing import Any
+from typing import Any, TypeVar
 
 import jwt
 from passlib.context import CryptContext
 
+from app.core import metrics
+from app.core.cache import TTLCache
 from app.core.config import settings
+from app.models import TokenPayload
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def build_pwd_context() -> CryptContext:
+    """
+    The first of PASSWORD_HASH_SCHEMES hashes new passwords, the others are
+    only verified and flagged for rehashing. Hashes with cost factors other
+    than the configured ones are flagged too.
+    """
+    options: dict[str, Any] = {}
+    if "bcrypt" in settings.PASSWORD_HASH_SCHEMES:
+        options.update(
+            bcrypt__rounds=settings.PASSWORD_BCRYPT_ROUNDS,
+            bcrypt__min_rounds=settings.PASSWORD_BCRYPT_ROUNDS,
+            bcrypt__max_rounds=settings.PASSWORD_BCRYPT_ROUNDS,
+        )
+    if "argon2" in settings.PASSWORD_HASH_SCHEMES:
+        options.update(
+            argon2__type="id",
+            argon2__time_cost=settings.PASSWORD_ARGON2_TIME_COST,
+            argon2__memory_cost=settings.PASSWORD_ARGON2_MEMORY_COST,
+            argon2__parallelism=settings.PASSWORD_ARGON2_PARALLELISM,
+        )
+    return CryptContext(
+        schemes=settings.PASSWORD_HASH_SCHEMES, deprecated="auto", **options
+    )
+
+
+pwd_context = build_pwd_context()
 
 
 ALGORITHM = "HS256"
 
+T = TypeVar("T")
+
+
+class PasswordHashingBusyError(Exception):
+    """
+    Raised when the password hashing pool already has the maximum number of
+    jobs running or queued.
+    """
+
+
+class PasswordHasher:
+    """
+    Runs password hashing in a process pool so it neither holds the GIL of
+    the API process nor piles up in Starlette's threadpool.
+
+    At most `workers + max_pending` calls are admitted at a time, callers
+    beyond that fail fast with `PasswordHashingBusyError`. With `workers=0`
+    hashing runs inline in the calling thread.
+    """
+
+    def __init__(self, *, workers: int, max_pending: int) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._lock = threading.Lock()
+        self._executor: ProcessPoolExecutor | None = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Spawn rather than fork, the API process runs threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    @contextmanager
+    def _admitted(self) -> Iterator[None]:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordHashingBusyError()
+        start = time.perf_counter()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+                self.total_seconds += time.perf_counter() - start
+            self._slots.release()
 
-def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
+    def run(self, fn: Callable[..., T], *args: Any) -> T:
+        if self.workers <= 0:
+            return fn(*args)
+        with self._admitted():
+            return self._get_executor().submit(fn, *args).result()
+
+    def map(self, fn: Callable[[Any], T], items: Sequence[Any]) -> list[T]:
+        """
+        Apply `fn` to every item, spread over all workers in chunks. The whole
+        batch is admitted as a single call.
+        """
+        if self.workers <= 0:
+            return [fn(item) for item in items]
+        chunksize = max(1, len(items) // (self.workers * 4))
+        with self._admitted():
+            return list(self._get_executor().map(fn, items, chunksize=chunksize))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "in_flight": self.in_flight,
+                "queued": max(self.in_flight - self.workers, 0),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "total_seconds": round(self.total_seconds, 3),
+            }
+
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
+metrics.register("password_hasher", password_hasher.stats)
+# Bulk hashing gets its own processes, a batch queued on `password_hasher`
+# would delay every interactive call behind it
+bulk_password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_BULK_WORKERS,
+    max_pending=settings.PASSWORD_HASH_BULK_MAX_PENDING,
+)
+metrics.register("bulk_password_hasher", bulk_password_hasher.stats)
+
+
+# Decoded payloads of verified tokens keyed by the token's SHA-256 digest,
+# an entry never outlives the token's own expiry
+token_cache: TTLCache[bytes, TokenPayload] = TTLCache(
+    maxsize=settings.TOKEN_CACHE_MAX_SIZE, ttl=settings.TOKEN_CACHE_TTL_SECONDS
+)
+metrics.register("token_cache", token_cache.stats)
+
+
+def create_access_token(
+    subject: str | Any,
+    expires_delta: timedelta,
+    *,
+    is_active: bool = True,
+    is_superuser: bool = False,
+) -> str:
     expire = datetime.now(timezone.utc) + expires_delta
-    to_encode = {"exp": expire, "sub": str(subject)}
+    to_encode = {
+        "exp": expire,
+        "sub": str(subject),
+        "type": "access",
+        "is_active": is_active,
+        "is_superuser": is_superuser,
+    }
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+def create_refresh_token(subject: str | Any, expires_delta: timedelta) -> str:
+    expire = datetime.now(timezone.utc) + expires_delta
+    to_encode = {"exp": expire, "sub": str(subject), "type": "refresh"}
+    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
+    return encoded_jwt
+
+
+def decode_token(token: str) -> TokenPayload:
+    """
+    Verify and decode an access or refresh token, raising `InvalidTokenError`
+    or `ValidationError` like `jwt.decode` and `TokenPayload` would.
+    """
+    digest = hashlib.sha256(token.encode()).digest()
+    token_data = token_cache.get(digest)
+    if token_data is not None:
+        return token_data
+
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+    token_data = TokenPayload(**payload)
+    if "exp" in payload:
+        ttl = min(token_cache.ttl, payload["exp"] - time.time())
+        if ttl > 0:
+            token_cache.set(digest, token_data, ttl=ttl)
+    return token_data
+
+
+# Module level so they can be pickled into the hashing pool
+def _verify(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
-def get_password_hash(password: str) -> str:
+def _hash(password: str) -> str:
     return pwd_context.hash(password)
+
+
+def _verify_and_update(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return password_hasher.run(_verify, plain_password, hashed_password)
+
+
+def get_password_hash(password: str) -> str:
+    return password_hasher.run(_hash, password)
+
+
+def get_password_hashes(passwords: Sequence[str]) -> list[str]:
+    return bulk_password_hasher.map(_hash, passwords)
+
+
+def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    """
+    Verify a password and, if its hash does not match the current policy,
+    also return a new hash to store in its place.
+    """
+    return password_hasher.run(_verify_and_update, plain_password, hashed_password)
@@ -0,0 +1,239 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Protocol
+
+from sqlalchemy import Engine
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, col, delete, func, update
+
+from app.core import metrics
+from app.core.config import settings
+from app.models import LoginThrottleBucket
+
+
+class ThrottleBackend(Protocol):
+    """
+    Storage for token buckets holding up to `capacity` tokens that refill at
+    `rate` tokens per second.
+    """
+
+    def take(self, key: str, *, capacity: int, rate: float) -> float:
+        """
+        Atomically take a token if the bucket holds a whole one and return 0,
+        otherwise leave the bucket as is and return the seconds until it will.
+        """
+        ...
+
+    def refund(self, key: str, *, capacity: int, rate: float) -> None:
+        """
+        Give back a token taken with `take`, never going above capacity.
+        """
+        ...
+
+
+def _refill(
+    tokens: float, updated_at: float, now: float, *, capacity: int, rate: float
+) -> float:
+    return min(capacity, tokens + (now - updated_at) * rate)
+
+
+class MemoryThrottleBackend:
+    """
+    Buckets in a bounded dict of the current process, each worker throttles
+    on its own.
+    """
+
+    def __init__(self, *, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, *, capacity: int, rate: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = _refill(tokens, updated_at, now, capacity=capacity, rate=rate)
+            retry_after = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if not retry_after:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    def refund(self, key: str, *, capacity: int, rate: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                return
+            tokens = _refill(*bucket, now, capacity=capacity, rate=rate)
+            self._buckets[key] = (min(capacity, tokens + 1), now)
+
+
+class DatabaseThrottleBackend:
+    """
+    Buckets in the login_throttle_bucket table, shared by all workers. Each
+    take is a single atomic upsert that only updates a bucket holding a
+    whole token.
+
+    A missing bucket counts as full, so buckets left alone for `idle_seconds`,
+    long enough for any of them to refill completely, are deleted. Every
+    `prune_every`-th take of a worker does so, keeping the table from growing
+    with every key ever tried.
+    """
+
+    def __init__(
+        self, engine: Engine, *, idle_seconds: float, prune_every: int = 100
+    ) -> None:
+        self.engine = engine
+        self.idle_seconds = idle_seconds
+        self.prune_every = prune_every
+        self._takes = itertools.count(1)
+
+    def take(self, key: str, *, capacity: int, rate: float) -> float:
+        now = time.time()
+        table = LoginThrottleBucket.__table__  # type: ignore[attr-defined]
+        refilled = func.least(
+            capacity, table.c.tokens + (now - table.c.updated_at) * rate
+        )
+        statement = (
+            insert(table)
+            .values(key=key, tokens=capacity - 1, updated_at=now)
+            .on_conflict_do_update(
+                index_elements=[table.c.key],
+                set_={"tokens": refilled - 1, "updated_at": now},
+                where=refilled >= 1,
+            )
+            .returning(table.c.key)
+        )
+        with Session(self.engine) as session:
+            taken = session.exec(statement).first() is not None  # type: ignore
+            bucket = None if taken else session.get(LoginThrottleBucket, key)
+            if next(self._takes) % self.prune_every == 0:
+                self._prune(session, now)
+            session.commit()
+        if bucket is None:
+            return 0.0
+        tokens = _refill(
+            bucket.tokens, bucket.updated_at, now, capacity=capacity, rate=rate
+        )
+        return max(0.0, (1 - tokens) / rate)
+
+    def _prune(self, session: Session, now: float) -> int:
+        statement = delete(LoginThrottleBucket).where(
+            col(LoginThrottleBucket.updated_at) < now - self.idle_seconds
+        )
+        return session.connection().execute(statement).rowcount
+
+    def prune(self) -> int:
+        """
+        Delete the idle buckets now, returns how many there were.
+        """
+        with Session(self.engine) as session:
+            pruned = self._prune(session, time.time())
+            session.commit()
+        return pruned
+
+    def refund(self, key: str, *, capacity: int, rate: float) -> None:
+        now = time.time()
+        table = LoginThrottleBucket.__table__  # type: ignore[attr-defined]
+        refilled = func.least(
+            capacity, table.c.tokens + (now - table.c.updated_at) * rate
+        )
+        statement = (
+            update(table)
+            .where(table.c.key == key)
+            .values(tokens=func.least(capacity, refilled + 1), updated_at=now)
+        )
+        with Session(self.engine) as session:
+            session.exec(statement)  # type: ignore
+            session.commit()
+
+
+class LoginThrottle:
+    """
+    Per-account, and optionally per-IP, token buckets for login attempts.
+    Every attempt reserves a token from each bucket before the password is
+    checked and successful ones get it back, so only failures use up the
+    buckets and a concurrent burst can't get more attempts through than the
+    buckets hold.
+    """
+
+    def __init__(self, backend: ThrottleBackend) -> None:
+        self.backend = backend
+        self.admitted = 0
+        self.rejected = 0
+        self.released = 0
+
+    def _buckets(self, ip: str, email: str) -> list[tuple[str, int, float]]:
+        buckets = [
+            (
+                f"account:{email.lower()}",
+                settings.LOGIN_THROTTLE_ACCOUNT_CAPACITY,
+                settings.LOGIN_THROTTLE_ACCOUNT_PER_MINUTE / 60,
+            )
+        ]
+        if settings.LOGIN_THROTTLE_PER_IP:
+            buckets.append(
+                (
+                    f"ip:{ip}",
+                    settings.LOGIN_THROTTLE_IP_CAPACITY,
+                    settings.LOGIN_THROTTLE_IP_PER_MINUTE / 60,
+                )
+            )
+        return buckets
+
+    def acquire(self, *, ip: str, email: str) -> float:
+        """
+        Reserve a token from each bucket for an attempt. Returns 0 if the
+        attempt is allowed, otherwise the seconds the caller has to wait, in
+        which case nothing stays reserved.
+        """
+        taken: list[tuple[str, int, float]] = []
+        for key, capacity, rate in self._buckets(ip, email):
+            retry_after = self.backend.take(key, capacity=capacity, rate=rate)
+            if retry_after:
+                for key, capacity, rate in taken:
+                    self.backend.refund(key, capacity=capacity, rate=rate)
+                self.rejected += 1
+                return retry_after
+            taken.append((key, capacity, rate))
+        self.admitted += 1
+        return 0.0
+
+    def release(self, *, ip: str, email: str) -> None:
+        """
+        Give back the tokens of an attempt that did not fail on the password.
+        """
+        self.released += 1
+        for key, capacity, rate in self._buckets(ip, email):
+            self.backend.refund(key, capacity=capacity, rate=rate)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": type(self.backend).__name__,
+            "failures": self.admitted - self.released,
+            "rejected": self.rejected,
+        }
+
+
+def _build_backend() -> ThrottleBackend:
+    if settings.LOGIN_THROTTLE_BACKEND == "database":
+        from app.core.db import engine
+
+        # Longest time any bucket needs to refill from empty
+        idle_seconds = 60 * max(
+            settings.LOGIN_THROTTLE_ACCOUNT_CAPACITY
+            / settings.LOGIN_THROTTLE_ACCOUNT_PER_MINUTE,
+            settings.LOGIN_THROTTLE_IP_CAPACITY / settings.LOGIN_THROTTLE_IP_PER_MINUTE,
+        )
+        return DatabaseThrottleBackend(engine, idle_seconds=idle_seconds)
+    return MemoryThrottleBackend(maxsize=settings.LOGIN_THROTTLE_MEMORY_MAX_KEYS)
+
+
+login_throttle = LoginThrottle(_build_backend())
+metrics.register("login_throttle", login_throttle.stats)
@@ -1,18 +1,116 @@
+import typing
 import uuid
+from collections.abc import Collection, Sequence
+from typing import Any
+
+from sqlalchemy import (
+    ColumnElement,
+    CompoundSelect,
+    Select,
+    String,
+    bindparam,
+    cast,
+    except_,
+    literal_column,
+)
+from sqlalchemy.dialects.postgresql import JSONPATH
+from sqlalchemy.exc import DataError, ProgrammingError
+from sqlalchemy.orm import QueryableAttribute, defer, make_transient_to_detached
+from sqlmodel import (
+    Session,
+    and_,
+    col,
+    delete,
+    exists,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+)
 
-from sqlmodel import Session, select
-
-from app.core.security import get_password_hash, verify_password
+from app.core import metrics
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.security import get_password_hash, verify_and_update_password
 from app.models import (
     CollaboratorInfo,
     CollaboratorRole,
     Prototype,
+    PrototypeAccess,
+    PrototypeAccessRole,
     PrototypeCollaborator,
     PrototypeCreate,
+    PrototypeSummariesPublic,
+    PrototypeUpdate,
+    PrototypeVisibility,
     User,
     UserCreate,
+    UserPublic,
     UserUpdate,
 )
+from app.utils import encode_cursor
+
+# Public catalog pages keyed by (cursor, page size), cleared by any write
+# that adds, changes or removes a public prototype
+public_catalog_cache: TTLCache[
+    tuple[uuid.UUID | None, int], PrototypeSummariesPublic
+] = TTLCache(
+    maxsize=settings.PUBLIC_CATALOG_CACHE_MAX_SIZE,
+    ttl=settings.PUBLIC_CATALOG_CACHE_TTL_SECONDS,
+)
+
+# Public catalog pages are fetched and cached at the smallest of these sizes
+# covering the requested limit, so varying the limit can't bypass the cache
+PUBLIC_CATALOG_PAGE_SIZES = sorted({10, 25, 50, 100, 250, settings.PAGE_MAX_LIMIT})
+
+
+# Effective role decisions keyed by (user_id, prototype_id), invalidated by
+# the crud functions that change collaborators, ownership or visibility
+acl_cache: TTLCache[tuple[uuid.UUID, uuid.UUID], PrototypeAccessRole] = TTLCache(
+    maxsize=settings.ACL_CACHE_MAX_SIZE, ttl=settings.ACL_CACHE_TTL_SECONDS
+)
+
+# Authorization and profile fields of users resolved from access tokens, keyed
+# by user ID and invalidated by the user and password updates below and by
+# user deletion. The password hash is never cached.
+user_cache: TTLCache[uuid.UUID, dict[str, Any]] = TTLCache(
+    maxsize=settings.USER_CACHE_MAX_SIZE, ttl=settings.USER_CACHE_TTL_SECONDS
+)
+USER_CACHE_FIELDS = set(UserPublic.model_fields)
+
+metrics.register("public_catalog_cache", public_catalog_cache.stats)
+metrics.register("acl_cache", acl_cache.stats)
+metrics.register("user_cache", user_cache.stats)
+
+
+def _invalidate_public_catalog(*visibilities: str | None) -> None:
+    if PrototypeVisibility.PUBLIC in visibilities:
+        public_catalog_cache.clear()
+
+
+def _invalidate_prototype_acl(prototype_id: uuid.UUID) -> None:
+    acl_cache.pop_where(lambda key: key[1] == prototype_id)
+
+
+def _invalidate_deleted_user(
+    user_id: uuid.UUID, prototype_ids: Collection[uuid.UUID]
+) -> None:
+    """
+    Drop cached state for a deleted user and the prototypes they owned.
+    """
+    user_cache.pop(user_id)
+    deleted = set(prototype_ids)
+    acl_cache.pop_where(lambda key: key[0] == user_id or key[1] in deleted)
+    if deleted:
+        public_catalog_cache.clear()
+
+
+# Writes are a single round trip: ids are generated client-side, so nothing is
+# read back after the flush. The one server-computed column,
+# `Prototype.search_vector`, is filled in by its trigger and deliberately left
+# stale on the returned objects, it is only used in SQL and never serialized.
+# Request sessions do not expire objects on commit, see `deps.get_db`.
 
 
 def create_user(*, session: Session, user_create: UserCreate) -> User:
@@ -21,10 +119,47 @@ def create_user(*, session: Session, user_create: UserCreate) -> User:
     )
     session.add(db_obj)
     session.commit()
-    session.refresh(db_obj)
     return db_obj
 
 
+def get_existing_emails(*, session: Session, emails: Collection[str]) -> set[str]:
+    """
+    Return which of `emails` belong to existing users, lowercased, with a
+    single query.
+    """
+    if not emails:
+        return set()
+    lowered = func.lower(User.email)
+    statement = select(lowered).where(lowered.in_({email.lower() for email in emails}))
+    return set(session.exec(statement).all())
+
+
+def create_users(
+    *,
+    session: Session,
+    users_in: Sequence[UserCreate],
+    hashed_passwords: Sequence[str],
+) -> list[uuid.UUID]:
+    """
+    Create many users with one executemany INSERT and a single commit.
+    Passwords are hashed by the caller, see `get_password_hashes`. Returns
+    the users' IDs in input order.
+    """
+    users = [
+        {
+            "id": uuid.uuid4(),
+            **user_in.model_dump(exclude={"password"}),
+            "hashed_password": hashed_password,
+        }
+        for user_in, hashed_password in zip(users_in, hashed_passwords, strict=True)
+    ]
+    if not users:
+        return []
+    session.exec(insert(User), params=users)  # type: ignore
+    session.commit()
+    return [user["id"] for user in users]
+
+
 def update_user(*, session: Session, db_user: User, user_in: UserUpdate) -> User:
     user_data = user_in.model_dump(exclude_unset=True)
     extra_data = {}
@@ -35,28 +170,106 @@ def update_user(*, session: Session, db_user: User, user_in: UserUpdate) -> User
     db_user.sqlmodel_update(user_data, update=extra_data)
     session.add(db_user)
     session.commit()
-    session.refresh(db_user)
+    invalidate_user(db_user.id)
     return db_user
 
 
+def invalidate_user(user_id: uuid.UUID) -> None:
+    user_cache.pop(user_id)
+
+
+def delete_user(*, session: Session, user_id: uuid.UUID) -> bool:
+    """
+    Delete a user and the prototypes they own in two statements, the foreign
+    keys cascade to their collaborator and access rows. Returns False if the
+    user does not exist.
+    """
+    statement = (
+        delete(Prototype)
+        .where(col(Prototype.owner_id) == user_id)
+        .returning(col(Prototype.id))
+    )
+    prototype_ids = session.exec(statement).scalars().all()  # type: ignore
+    result = session.exec(delete(User).where(col(User.id) == user_id))  # type: ignore
+    session.commit()
+    _invalidate_deleted_user(user_id, prototype_ids)
+    return bool(result.rowcount)
+
+
+def list_users(
+    *,
+    session: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after: uuid.UUID | None = None,
+) -> list[User]:
+    statement = select(User).order_by(col(User.id)).limit(limit)
+    if after is not None:
+        statement = statement.where(User.id > after)
+    else:
+        statement = statement.offset(skip)
+    return list(session.exec(statement).all())
+
+
+def count_users(*, session: Session) -> int:
+    return session.exec(select(func.count()).select_from(User)).one()
+
+
+# Hot lookups run statements built once with bound parameters, their cache
+# key is memoized so a call neither rebuilds the construct nor its key
+_user_by_email = select(User).where(
+    func.lower(User.email) == func.lower(bindparam("email", type_=String))
+)
+_user_by_id = select(User).where(User.id == bindparam("user_id"))
+
+
 def get_user_by_email(*, session: Session, email: str) -> User | None:
-    statement = select(User).where(User.email == email)
-    session_user = session.exec(statement).first()
+    session_user = session.exec(_user_by_email, params={"email": email}).first()
     return session_user
 
 
 def get_user_by_id(*, session: Session, user_id: uuid.UUID) -> User | None:
-    statement = select(User).where(User.id == user_id)
-    session_user = session.exec(statement).first()
+    session_user = session.exec(_user_by_id, params={"user_id": user_id}).first()
     return session_user
 
 
+def get_user_for_auth(*, session: Session, user_id: uuid.UUID) -> User | None:
+    """
+    Like `get_user_by_id`, but served from the user cache when possible. A
+    cached user is merged into `session` without a query, so it can still be
+    updated and deleted like a loaded one. It only holds `USER_CACHE_FIELDS`,
+    any other column, like `hashed_password`, is loaded from `session` on
+    first access.
+    """
+    user_data = user_cache.get(user_id)
+    if user_data is not None:
+        cached_user = User(**user_data)
+        make_transient_to_detached(cached_user)
+        return session.merge(cached_user, load=False)
+
+    generation = user_cache.generation
+    user = session.get(User, user_id)
+    if user:
+        user_cache.set(
+            user_id,
+            user.model_dump(include=USER_CACHE_FIELDS),
+            generation=generation,
+        )
+    return user
+
+
 def authenticate(*, session: Session, email: str, password: str) -> User | None:
     db_user = get_user_by_email(session=session, email=email)
     if not db_user:
         return None
-    if not verify_password(password, db_user.hashed_password):
+    verified, new_hash = verify_and_update_password(password, db_user.hashed_password)
+    if not verified:
         return None
+    if new_hash:
+        db_user.hashed_password = new_hash
+        session.add(db_user)
+        session.commit()
+        invalidate_user(db_user.id)
     return db_user
 
 
@@ -65,37 +278,456 @@ def create_prototype(
 ) -> Prototype:
     db_prototype = Prototype.model_validate(prototype_in, update={"owner_id": owner_id})
     session.add(db_prototype)
+    session.add(
+        PrototypeAccess(
+            user_id=owner_id,
+            prototype_id=db_prototype.id,
+            role=PrototypeAccessRole.OWNER,
+        )
+    )
     session.commit()
-    session.refresh(db_prototype)
+    _invalidate_public_catalog(db_prototype.visibility)
     return db_prototype
 
 
+def create_prototypes(
+    *, session: Session, prototypes_in: Collection[PrototypeCreate], owner_id: uuid.UUID
+) -> list[uuid.UUID]:
+    """
+    Create many prototypes owned by `owner_id` in one transaction, as one
+    executemany INSERT per table. Returns their IDs in input order.
+    """
+    prototypes = [
+        {"id": uuid.uuid4(), "owner_id": owner_id, **prototype_in.model_dump()}
+        for prototype_in in prototypes_in
+    ]
+    if not prototypes:
+        return []
+    session.exec(insert(Prototype), params=prototypes)  # type: ignore
+    session.exec(  # type: ignore
+        insert(PrototypeAccess),
+        params=[
+            {
+                "user_id": owner_id,
+                "prototype_id": prototype["id"],
+                "role": PrototypeAccessRole.OWNER.value,
+            }
+            for prototype in prototypes
+        ],
+    )
+    session.commit()
+    _invalidate_public_catalog(*{prototype["visibility"] for prototype in prototypes})
+    return [prototype["id"] for prototype in prototypes]
+
+
+def update_prototype(
+    *, session: Session, db_prototype: Prototype, prototype_in: PrototypeUpdate
+) -> Prototype:
+    previous_visibility = db_prototype.visibility
+    update_dict = prototype_in.model_dump(exclude_unset=True)
+    db_prototype.sqlmodel_update(update_dict)
+    session.add(db_prototype)
+    session.commit()
+    _invalidate_public_catalog(previous_visibility, db_prototype.visibility)
+    if db_prototype.visibility != previous_visibility:
+        _invalidate_prototype_acl(db_prototype.id)
+    return db_prototype
+
+
+def delete_prototype(*, session: Session, db_prototype: Prototype) -> None:
+    visibility = db_prototype.visibility
+    session.delete(db_prototype)
+    session.commit()
+    _invalidate_public_catalog(visibility)
+    _invalidate_prototype_acl(db_prototype.id)
+
+
+# SQLModel types model attributes as their values, loader options want the
+# instrumented attribute
+_prototype_content = typing.cast(QueryableAttribute[Any], Prototype.content)
+_prototype_search_vector = typing.cast(QueryableAttribute[Any], Prototype.search_vector)
+# Only ever read by the full-text search in SQL, every prototype query leaves
+# the tsvector in the database
+_defer_search_vector = defer(_prototype_search_vector)
+
+_prototype_by_id = (
+    select(Prototype)
+    .where(Prototype.id == bindparam("prototype_id"))
+    .options(_defer_search_vector)
+)
+
+
 def get_prototype(*, session: Session, prototype_id: uuid.UUID) -> Prototype | None:
-    statement = select(Prototype).where(Prototype.id == prototype_id)
-    return session.exec(statement).first()
+    return session.exec(_prototype_by_id, params={"prototype_id": prototype_id}).first()
+
+
+VIEW_ROLES = {
+    PrototypeAccessRole.OWNER,
+    PrototypeAccessRole.EDITOR,
+    PrototypeAccessRole.VIEWER,
+    PrototypeAccessRole.PUBLIC,
+}
+EDIT_ROLES = {PrototypeAccessRole.OWNER, PrototypeAccessRole.EDITOR}
+
+
+_prototype_with_role = (
+    select(Prototype, PrototypeAccess.role)
+    .outerjoin(
+        PrototypeAccess,
+        and_(
+            col(PrototypeAccess.prototype_id) == Prototype.id,
+            col(PrototypeAccess.user_id) == bindparam("user_id"),
+        ),
+    )
+    .where(Prototype.id == bindparam("prototype_id"))
+    .options(_defer_search_vector)
+)
+_prototype_with_role_no_content = _prototype_with_role.options(
+    defer(_prototype_content, raiseload=True)
+)
+
+
+def get_prototype_with_role(
+    *,
+    session: Session,
+    prototype_id: uuid.UUID,
+    user_id: uuid.UUID,
+    with_content: bool = True,
+) -> tuple[Prototype | None, PrototypeAccessRole]:
+    # The prototype and the user's prototype_access row in one statement
+    generation = acl_cache.generation
+    statement = (
+        _prototype_with_role if with_content else _prototype_with_role_no_content
+    )
+    result = session.exec(
+        statement, params={"prototype_id": prototype_id, "user_id": user_id}
+    ).first()
+    if result is None:
+        return None, PrototypeAccessRole.NONE
+
+    prototype, access_role = result
+    role = _effective_role(access_role, prototype.visibility)
+    _cache_role(session, user_id, prototype_id, role, generation)
+    return prototype, role
+
+
+def _cache_role(
+    session: Session,
+    user_id: uuid.UUID,
+    prototype_id: uuid.UUID,
+    role: PrototypeAccessRole,
+    generation: int,
+) -> None:
+    # A replica may not have caught up with a write that just invalidated
+    # the entry, caching what it returns would keep the stale decision
+    if not session.info.get("replica"):
+        acl_cache.set((user_id, prototype_id), role, generation=generation)
+
+
+def _effective_role(access_role: str | None, visibility: str) -> PrototypeAccessRole:
+    if access_role is not None:
+        return PrototypeAccessRole(access_role)
+    if visibility == PrototypeVisibility.PUBLIC:
+        return PrototypeAccessRole.PUBLIC
+    return PrototypeAccessRole.NONE
+
+
+def get_prototype_role(
+    *, session: Session, prototype_id: uuid.UUID, user_id: uuid.UUID
+) -> PrototypeAccessRole:
+    """
+    The user's effective role on a prototype, served from the ACL cache when
+    possible. Use for checks that do not need the prototype itself.
+    """
+    role = acl_cache.get((user_id, prototype_id))
+    if role is None:
+        _, role = get_prototype_with_role(
+            session=session,
+            prototype_id=prototype_id,
+            user_id=user_id,
+            with_content=False,
+        )
+    return role
+
+
+def get_prototypes_by_ids(
+    *, session: Session, prototype_ids: Collection[uuid.UUID], user_id: uuid.UUID
+) -> tuple[list[Prototype], list[uuid.UUID]]:
+    """
+    The prototypes among `prototype_ids` the user can view, in request order,
+    and the requested IDs that are missing or not viewable.
+    """
+    requested = list(dict.fromkeys(prototype_ids))
+    if not requested:
+        return [], []
+
+    generation = acl_cache.generation
+    statement = (
+        select(Prototype, PrototypeAccess.role)
+        .outerjoin(
+            PrototypeAccess,
+            and_(
+                col(PrototypeAccess.prototype_id) == Prototype.id,
+                col(PrototypeAccess.user_id) == user_id,
+            ),
+        )
+        .where(
+            col(Prototype.id).in_(requested),
+            or_(
+                col(PrototypeAccess.role).is_not(None),
+                _is_public(),
+            ),
+        )
+        .options(_defer_search_vector)
+    )
+    found: dict[uuid.UUID, Prototype] = {}
+    for prototype, access_role in session.exec(statement).all():
+        role = _effective_role(access_role, prototype.visibility)
+        _cache_role(session, user_id, prototype.id, role, generation)
+        found[prototype.id] = prototype
+
+    data = [found[id] for id in requested if id in found]
+    denied = [id for id in requested if id not in found]
+    return data, denied
+
+
+def _is_public() -> ColumnElement[bool]:
+    # Inlined rather than bound, so Postgres can match it to the predicate of
+    # ix_prototype_public_id even in a generic plan for a prepared statement
+    return col(Prototype.visibility) == literal_column("'public'")
+
+
+def _has_access(user_id: uuid.UUID) -> ColumnElement[bool]:
+    return exists().where(
+        col(PrototypeAccess.prototype_id) == Prototype.id,
+        col(PrototypeAccess.user_id) == user_id,
+    )
+
+
+def count_user_prototypes(*, session: Session, user_id: uuid.UUID) -> int:
+    statement = (
+        select(func.count())
+        .select_from(PrototypeAccess)
+        .where(PrototypeAccess.user_id == user_id)
+    )
+    return session.exec(statement).one()
+
+
+def _prototype_options(with_content: bool) -> list[Any]:
+    if with_content:
+        return [_defer_search_vector]
+    # Summaries never read the content column, raise instead of lazy loading it
+    return [_defer_search_vector, defer(_prototype_content, raiseload=True)]
+
+
+def get_user_prototypes_after(
+    *,
+    session: Session,
+    user_id: uuid.UUID,
+    after: uuid.UUID,
+    limit: int = 100,
+    with_content: bool = True,
+) -> list[Prototype]:
+    # Keyset pagination, seek past the cursor instead of skipping rows
+    statement = (
+        select(Prototype)
+        .join(PrototypeAccess, col(PrototypeAccess.prototype_id) == Prototype.id)
+        .where(PrototypeAccess.user_id == user_id, PrototypeAccess.prototype_id > after)
+        .order_by(col(PrototypeAccess.prototype_id))
+        .limit(limit)
+        .options(*_prototype_options(with_content))
+    )
+    return list(session.exec(statement).all())
 
 
-def get_user_prototypes(*, session: Session, user_id: uuid.UUID) -> list[Prototype]:
-    # Get prototypes where user is owner
-    owned_statement = select(Prototype).where(Prototype.owner_id == user_id)
-    owned_prototypes = session.exec(owned_statement).all()
+def get_user_prototypes(
+    *,
+    session: Session,
+    user_id: uuid.UUID,
+    skip: int = 0,
+    limit: int = 100,
+    after: uuid.UUID | None = None,
+    with_content: bool = True,
+) -> tuple[list[Prototype], int]:
+    # Prototypes the user owns or collaborates on, one prototype_access row
+    # each, ordered, paged and counted by Postgres in a single statement
+    if after is not None:
+        prototypes = get_user_prototypes_after(
+            session=session,
+            user_id=user_id,
+            after=after,
+            limit=limit,
+            with_content=with_content,
+        )
+        return prototypes, count_user_prototypes(session=session, user_id=user_id)
+
+    statement_with_count = (
+        select(Prototype, func.count().over())
+        .join(PrototypeAccess, col(PrototypeAccess.prototype_id) == Prototype.id)
+        .where(PrototypeAccess.user_id == user_id)
+        .order_by(col(PrototypeAccess.prototype_id))
+        .offset(skip)
+        .limit(limit)
+        .options(*_prototype_options(with_content))
+    )
+    results = session.exec(statement_with_count).all()
+    if results:
+        return [prototype for prototype, _ in results], results[0][1]
+    if skip == 0:
+        return [], 0
+
+    # Page past the end, the window count is not available without rows
+    return [], count_user_prototypes(session=session, user_id=user_id)
+
 
-    # Get prototypes where user is collaborator
-    collaborator_statement = (
+def get_public_prototypes_page(
+    *, session: Session, limit: int = 100, after: uuid.UUID | None = None
+) -> list[Prototype]:
+    statement = (
         select(Prototype)
-        .join(PrototypeCollaborator)
-        .where(PrototypeCollaborator.user_id == user_id)
+        .where(_is_public())
+        .order_by(col(Prototype.id))
+        .limit(limit)
+        .options(*_prototype_options(with_content=False))
+    )
+    if after is not None:
+        statement = statement.where(Prototype.id > after)
+    return list(session.exec(statement).all())
+
+
+def count_public_prototypes(*, session: Session) -> int:
+    statement = select(func.count()).select_from(Prototype).where(_is_public())
+    return session.exec(statement).one()
+
+
+def public_catalog_page_size(limit: int) -> int:
+    return next((size for size in PUBLIC_CATALOG_PAGE_SIZES if size >= limit), limit)
+
+
+def cache_public_catalog(
+    *,
+    session: Session,
+    prototypes: list[Prototype],
+    count: int,
+    page_size: int,
+    after: uuid.UUID | None,
+    generation: int,
+) -> PrototypeSummariesPublic:
+    next_cursor = (
+        encode_cursor(prototypes[-1].id)
+        if prototypes and len(prototypes) == page_size
+        else None
+    )
+    catalog = PrototypeSummariesPublic(
+        data=prototypes, count=count, next_cursor=next_cursor
     )
-    collaborator_prototypes = session.exec(collaborator_statement).all()
+    # Like `_cache_role`, a lagging replica's page could outlive the write
+    # that invalidated it
+    if not session.info.get("replica"):
+        public_catalog_cache.set((after, page_size), catalog, generation=generation)
+    return catalog
+
+
+def limit_public_catalog(
+    catalog: PrototypeSummariesPublic, limit: int
+) -> PrototypeSummariesPublic:
+    """
+    Cut a cached catalog page down to the first `limit` prototypes.
+    """
+    if len(catalog.data) <= limit:
+        return catalog
+    data = catalog.data[:limit]
+    return PrototypeSummariesPublic(
+        data=data, count=catalog.count, next_cursor=encode_cursor(data[-1].id)
+    )
+
 
-    # Use a dictionary with prototype IDs as keys to remove duplicates
-    all_prototypes = {p.id: p for p in owned_prototypes + collaborator_prototypes}
-    return list(all_prototypes.values())
+def get_public_prototypes(
+    *, session: Session, limit: int = 100, after: uuid.UUID | None = None
+) -> PrototypeSummariesPublic:
+    page_size = public_catalog_page_size(limit)
+    catalog = public_catalog_cache.get((after, page_size))
+    if catalog is None:
+        generation = public_catalog_cache.generation
+        prototypes = get_public_prototypes_page(
+            session=session, limit=page_size, after=after
+        )
+        count = count_public_prototypes(session=session)
+        catalog = cache_public_catalog(
+            session=session,
+            prototypes=prototypes,
+            count=count,
+            page_size=page_size,
+            after=after,
+            generation=generation,
+        )
+    return limit_public_catalog(catalog, limit)
+
+
+def search_prototypes(
+    *,
+    session: Session,
+    user_id: uuid.UUID,
+    query: str,
+    skip: int = 0,
+    limit: int = 100,
+) -> tuple[list[Prototype], int]:
+    # Same access rules as can_access_prototype: public, owned or shared
+    is_visible = or_(_is_public(), _has_access(user_id))
+    ts_query = func.websearch_to_tsquery("english", query)
+    search_vector = col(Prototype.search_vector)
+    statement = (
+        select(Prototype, func.count().over())
+        .where(is_visible, search_vector.op("@@")(ts_query))
+        .order_by(func.ts_rank(search_vector, ts_query).desc(), col(Prototype.id))
+        .offset(skip)
+        .limit(limit)
+        .options(*_prototype_options(with_content=False))
+    )
+    results = session.exec(statement).all()
+    if not results:
+        return [], 0
+    return [prototype for prototype, _ in results], results[0][1]
 
 
-def get_public_prototypes(*, session: Session) -> list[Prototype]:
-    statement = select(Prototype).where(Prototype.visibility == "public")
-    return session.exec(statement).all()
+def search_prototype_content(
+    *,
+    session: Session,
+    user_id: uuid.UUID,
+    contains: dict[str, Any] | None = None,
+    path: str | None = None,
+    skip: int = 0,
+    limit: int = 100,
+) -> tuple[list[Prototype], int]:
+    """
+    Prototypes the user can access whose content contains `contains` and for
+    which the JSON path `path` returns an item, both served by the GIN index
+    on the content. Raises ValueError for an invalid JSON path.
+    """
+    content = _prototype_content
+    conditions = [or_(_is_public(), _has_access(user_id))]
+    if contains is not None:
+        conditions.append(content.contains(contains))
+    if path is not None:
+        conditions.append(content.path_exists(cast(path, JSONPATH)))
+    statement = (
+        select(Prototype, func.count().over())
+        .where(*conditions)
+        .order_by(col(Prototype.id))
+        .offset(skip)
+        .limit(limit)
+        .options(*_prototype_options(with_content=False))
+    )
+    try:
+        results = session.exec(statement).all()
+    except (DataError, ProgrammingError):
+        session.rollback()
+        if path is None:
+            raise
+        raise ValueError("Invalid JSON path")
+    if not results:
+        return [], 0
+    return [prototype for prototype, _ in results], results[0][1]
 
 
 # Collaborator management functions
@@ -103,22 +735,27 @@ def add_collaborator(
     *,
     session: Session,
     prototype_id: uuid.UUID,
-    collaborator_email: str,
+    user_id: uuid.UUID,
     role: CollaboratorRole,
 ) -> CollaboratorInfo:
-    # Get user by email
-    user = get_user_by_email(session=session, email=collaborator_email)
+    user = session.get(User, user_id)
     if not user:
-        raise ValueError(f"User with email {collaborator_email} not found")
+        raise ValueError(f"User with id {user_id} not found")
 
     # Create collaborator relationship
     db_collaborator = PrototypeCollaborator(
-        prototype_id=prototype_id, user_id=user.id, role=role
+        prototype_id=prototype_id, user_id=user_id, role=role
     )
     session.add(db_collaborator)
+    # The owner keeps the owner role if added as a collaborator
+    if _get_access(session=session, prototype_id=prototype_id, user_id=user_id) is None:
+        session.add(
+            PrototypeAccess(user_id=user_id, prototype_id=prototype_id, role=role)
+        )
     session.commit()
+    acl_cache.pop((user_id, prototype_id))
 
-    return CollaboratorInfo(email=user.email, role=role, user_id=user.id)
+    return CollaboratorInfo(role=role, user_id=user_id)
 
 
 def update_collaborator_role(
@@ -138,89 +775,172 @@ def update_collaborator_role(
 
     db_collaborator.role = new_role
     session.add(db_collaborator)
+    db_access = _get_access(session=session, prototype_id=prototype_id, user_id=user_id)
+    if db_access and db_access.role != PrototypeAccessRole.OWNER:
+        db_access.role = new_role
+        session.add(db_access)
     session.commit()
+    acl_cache.pop((user_id, prototype_id))
 
-    user = get_user_by_id(session=session, user_id=user_id)
-    return CollaboratorInfo(
-        email=user.email,  # type: ignore
-        role=new_role,
-        user_id=user_id,
-    )
+    return CollaboratorInfo(role=new_role, user_id=user_id)
 
 
 def remove_collaborator(
-    *, session: Session, prototype_id: uuid.UUID, collaborator_email: str
+    *, session: Session, prototype_id: uuid.UUID, user_id: uuid.UUID
 ) -> None:
-    user = get_user_by_email(session=session, email=collaborator_email)
-    if not user:
-        raise ValueError(f"User with email {collaborator_email} not found")
-
     statement = select(PrototypeCollaborator).where(
         PrototypeCollaborator.prototype_id == prototype_id,
-        PrototypeCollaborator.user_id == user.id,
+        PrototypeCollaborator.user_id == user_id,
     )
     db_collaborator = session.exec(statement).first()
     if not db_collaborator:
         raise ValueError("Collaborator not found")
 
     session.delete(db_collaborator)
+    db_access = _get_access(session=session, prototype_id=prototype_id, user_id=user_id)
+    if db_access and db_access.role != PrototypeAccessRole.OWNER:
+        session.delete(db_access)
     session.commit()
+    acl_cache.pop((user_id, prototype_id))
 
 
-def get_prototype_collaborators(
-    *, session: Session, prototype_id: uuid.UUID
+def list_prototype_collaborators(
+    *,
+    session: Session,
+    prototype_id: uuid.UUID,
+    skip: int = 0,
+    limit: int | None = None,
+    after: uuid.UUID | None = None,
 ) -> list[CollaboratorInfo]:
     statement = (
-        select(PrototypeCollaborator, User)
-        .join(User)
+        select(PrototypeCollaborator)
         .where(PrototypeCollaborator.prototype_id == prototype_id)
+        .order_by(col(PrototypeCollaborator.user_id))
     )
+    if after is not None:
+        statement = statement.where(PrototypeCollaborator.user_id > after)
+    else:
+        statement = statement.offset(skip)
+    if limit is not None:
+        statement = statement.limit(limit)
     results = session.exec(statement).all()
-
     return [
-        CollaboratorInfo(email=user.email, role=collab.role, user_id=user.id)
-        for collab, user in results
+        CollaboratorInfo(user_id=collab.user_id, role=collab.role) for collab in results
     ]
 
 
-def can_access_prototype(
-    *, session: Session, user_id: uuid.UUID, prototype_id: uuid.UUID
+def count_prototype_collaborators(*, session: Session, prototype_id: uuid.UUID) -> int:
+    statement = (
+        select(func.count())
+        .select_from(PrototypeCollaborator)
+        .where(PrototypeCollaborator.prototype_id == prototype_id)
+    )
+    return session.exec(statement).one()
+
+
+_is_collaborator = select(
+    exists().where(
+        col(PrototypeCollaborator.prototype_id) == bindparam("prototype_id"),
+        col(PrototypeCollaborator.user_id) == bindparam("user_id"),
+    )
+)
+
+
+def is_prototype_collaborator(
+    *, session: Session, prototype_id: uuid.UUID, user_id: uuid.UUID
 ) -> bool:
-    prototype = get_prototype(session=session, prototype_id=prototype_id)
-    if not prototype:
-        return False
+    return session.exec(
+        _is_collaborator, params={"prototype_id": prototype_id, "user_id": user_id}
+    ).one()
 
-    # Check if prototype is public
-    if prototype.visibility == "public":
-        return True
 
-    # Check if user is owner
-    if prototype.owner_id == user_id:
-        return True
+def get_prototype_collaborators(
+    *,
+    session: Session,
+    prototype_id: uuid.UUID,
+    skip: int = 0,
+    limit: int | None = None,
+    after: uuid.UUID | None = None,
+) -> tuple[list[CollaboratorInfo], int]:
+    collaborators = list_prototype_collaborators(
+        session=session, prototype_id=prototype_id, skip=skip, limit=limit, after=after
+    )
+    count = count_prototype_collaborators(session=session, prototype_id=prototype_id)
+    return collaborators, count
 
-    # Check if user is collaborator
-    statement = select(PrototypeCollaborator).where(
-        PrototypeCollaborator.prototype_id == prototype_id,
-        PrototypeCollaborator.user_id == user_id,
+
+def can_access_prototype(
+    *, session: Session, user_id: uuid.UUID, prototype_id: uuid.UUID
+) -> bool:
+    role = get_prototype_role(
+        session=session, prototype_id=prototype_id, user_id=user_id
     )
-    return session.exec(statement).first() is not None
+    return role in VIEW_ROLES
 
 
 def can_edit_prototype(
     *, session: Session, user_id: uuid.UUID, prototype_id: uuid.UUID
 ) -> bool:
-    prototype = get_prototype(session=session, prototype_id=prototype_id)
-    if not prototype:
-        return False
+    role = get_prototype_role(
+        session=session, prototype_id=prototype_id, user_id=user_id
+    )
+    return role in EDIT_ROLES
 
-    # Check if user is owner
-    if prototype.owner_id == user_id:
-        return True
 
-    # Check if user is editor
-    statement = select(PrototypeCollaborator).where(
-        PrototypeCollaborator.prototype_id == prototype_id,
-        PrototypeCollaborator.user_id == user_id,
-        PrototypeCollaborator.role == CollaboratorRole.EDITOR,
+# Prototype access table maintenance
+def _get_access(
+    *, session: Session, prototype_id: uuid.UUID, user_id: uuid.UUID
+) -> PrototypeAccess | None:
+    return session.get(
+        PrototypeAccess, {"user_id": user_id, "prototype_id": prototype_id}
+    )
+
+
+def _expected_access_statement() -> CompoundSelect:
+    # Owners, plus collaborators who do not own the prototype
+    owners: Select[Any] = select(
+        col(Prototype.owner_id).label("user_id"),
+        col(Prototype.id).label("prototype_id"),
+        literal(PrototypeAccessRole.OWNER.value).label("role"),
+    )
+    collaborators = (
+        select(
+            col(PrototypeCollaborator.user_id),
+            col(PrototypeCollaborator.prototype_id),
+            col(PrototypeCollaborator.role),
+        )
+        .join(Prototype, col(Prototype.id) == PrototypeCollaborator.prototype_id)
+        .where(Prototype.owner_id != PrototypeCollaborator.user_id)
+    )
+    return owners.union_all(collaborators)
+
+
+def rebuild_prototype_access(*, session: Session) -> int:
+    expected = _expected_access_statement().subquery()
+    session.exec(delete(PrototypeAccess))  # type: ignore
+    insert_statement = insert(PrototypeAccess).from_select(
+        ["user_id", "prototype_id", "role"], expected.select()
+    )
+    session.exec(insert_statement)  # type: ignore
+    session.commit()
+    acl_cache.clear()
+    count_statement = select(func.count()).select_from(PrototypeAccess)
+    return session.exec(count_statement).one()
+
+
+def check_prototype_access(*, session: Session) -> tuple[int, int]:
+    """
+    Return the number of missing and unexpected prototype_access rows,
+    a role mismatch counts as one of each.
+    """
+    expected = _expected_access_statement().subquery().select()
+    actual = select(
+        col(PrototypeAccess.user_id),
+        col(PrototypeAccess.prototype_id),
+        col(PrototypeAccess.role),
     )
-    return session.exec(statement).first() is not None
+    missing = except_(expected, actual).subquery()
+    unexpected = except_(actual, expected).subquery()
+    missing_count = session.exec(select(func.count()).select_from(missing)).one()
+    unexpected_count = session.exec(select(func.count()).select_from(unexpected)).one()
+    return missing_count, unexpected_count
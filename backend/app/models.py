@@ -1,20 +1,55 @@
 import enum
 import uuid
-from typing import Any
+from typing import Any, Literal
 
-from pydantic import EmailStr
-from sqlmodel import JSON, Field, Relationship, SQLModel
+from pydantic import EmailStr, model_validator
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlmodel import Column, Field, Index, Relationship, SQLModel
+from typing_extensions import Self
 
 
 # Junction table for prototype collaborators
 class PrototypeCollaborator(SQLModel, table=True):
     __tablename__ = "prototype_collaborator"
+    __table_args__ = (
+        Index(
+            "ix_prototype_collaborator_user_id_prototype_id", "user_id", "prototype_id"
+        ),
+    )
 
-    prototype_id: uuid.UUID = Field(foreign_key="prototype.id", primary_key=True)
-    user_id: uuid.UUID = Field(foreign_key="user.id", primary_key=True)
+    prototype_id: uuid.UUID = Field(
+        foreign_key="prototype.id", primary_key=True, ondelete="CASCADE"
+    )
+    user_id: uuid.UUID = Field(
+        foreign_key="user.id", primary_key=True, ondelete="CASCADE"
+    )
     role: str = Field(default="viewer")
 
 
+class PrototypeAccessRole(str, enum.Enum):
+    OWNER = "owner"
+    EDITOR = "editor"
+    VIEWER = "viewer"
+    # Effective roles only, never stored in prototype_access
+    PUBLIC = "public"
+    NONE = "none"
+
+
+# Denormalized owner and collaborator access per user, kept in sync by the
+# prototype and collaborator crud functions
+class PrototypeAccess(SQLModel, table=True):
+    __tablename__ = "prototype_access"
+
+    user_id: uuid.UUID = Field(
+        foreign_key="user.id", primary_key=True, ondelete="CASCADE"
+    )
+    prototype_id: uuid.UUID = Field(
+        foreign_key="prototype.id", primary_key=True, ondelete="CASCADE", index=True
+    )
+    role: str
+
+
 class PrototypeVisibility(str, enum.Enum):
     PRIVATE = "private"
     PUBLIC = "public"
@@ -44,6 +79,20 @@ class UserRegister(SQLModel):
     full_name: str | None = Field(default=None, max_length=255)
 
 
+# Outcome of one line of a user import, `id` of the created user or `error`
+# if the line was rejected
+class UserImportResult(SQLModel):
+    line: int
+    id: uuid.UUID | None = None
+    error: str | None = None
+
+
+class UserImportReport(SQLModel):
+    created: int
+    failed: int
+    results: list[UserImportResult]
+
+
 # Properties to receive via API on update, all are optional
 class UserUpdate(UserBase):
     email: EmailStr | None = Field(default=None, max_length=255)  # type: ignore
@@ -63,15 +112,23 @@ class UpdatePassword(SQLModel):
 # Database model for User
 class User(UserBase, table=True):
     __tablename__ = "user"
+    # Logins look emails up case-insensitively, so two emails differing only
+    # in case would be the same account
+    __table_args__ = (Index("ix_user_email_lower", text("lower(email)"), unique=True),)
 
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     hashed_password: str
-    owned_prototypes: list["Prototype"] = Relationship(back_populates="owner")
+    # Rows referencing a deleted user or prototype are removed by the
+    # database's ON DELETE CASCADE, the ORM never loads them to delete them
+    owned_prototypes: list["Prototype"] = Relationship(
+        back_populates="owner", passive_deletes="all"
+    )
     shared_prototypes: list["Prototype"] = Relationship(
         back_populates="collaborators",
         link_model=PrototypeCollaborator,
         sa_relationship_kwargs={
             "secondary": PrototypeCollaborator.__table__,
+            "passive_deletes": True,
         },
     )
 
@@ -84,13 +141,14 @@ class UserPublic(UserBase):
 class UsersPublic(SQLModel):
     data: list[UserPublic]
     count: int
+    next_cursor: str | None = None
 
 
 # Shared properties for Prototype
 class PrototypeBase(SQLModel):
     title: str = Field(min_length=1, max_length=255)
     description: str | None = Field(default=None, max_length=255)
-    content: dict[str, Any] = Field(default_factory=dict, sa_type=JSON)
+    content: dict[str, Any] = Field(default_factory=dict, sa_type=JSONB)
     visibility: str = Field(default="private")
 
 
@@ -109,16 +167,40 @@ class PrototypeUpdate(PrototypeBase):
 # Database model for Prototype
 class Prototype(PrototypeBase, table=True):
     __tablename__ = "prototype"
+    __table_args__ = (
+        Index("ix_prototype_owner_id_id", "owner_id", "id"),
+        Index("ix_prototype_search_vector", "search_vector", postgresql_using="gin"),
+        # Containment (@>) and JSON path (@?) queries on the content
+        Index(
+            "ix_prototype_content",
+            "content",
+            postgresql_using="gin",
+            postgresql_ops={"content": "jsonb_path_ops"},
+        ),
+        # The public catalog, in keyset order
+        Index(
+            "ix_prototype_public_id",
+            "id",
+            postgresql_where=text("visibility = 'public'"),
+        ),
+    )
 
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     title: str = Field(max_length=255)
-    owner_id: uuid.UUID = Field(foreign_key="user.id", nullable=False)
+    owner_id: uuid.UUID = Field(
+        foreign_key="user.id", nullable=False, ondelete="CASCADE"
+    )
+    # Maintained by a database trigger from title, description and command names
+    search_vector: str | None = Field(
+        default=None, sa_column=Column(TSVECTOR, nullable=True)
+    )
     owner: User = Relationship(back_populates="owned_prototypes")
     collaborators: list[User] = Relationship(
         back_populates="shared_prototypes",
         link_model=PrototypeCollaborator,
         sa_relationship_kwargs={
             "secondary": PrototypeCollaborator.__table__,
+            "passive_deletes": True,
         },
     )
 
@@ -132,6 +214,60 @@ class PrototypePublic(PrototypeBase):
 class PrototypesPublic(SQLModel):
     data: list[PrototypePublic]
     count: int
+    next_cursor: str | None = None
+
+
+# Multi-get request and response
+class PrototypeBatchGet(SQLModel):
+    ids: list[uuid.UUID] = Field(min_length=1)
+
+
+class PrototypesBatchPublic(SQLModel):
+    data: list[PrototypePublic]
+    # Requested IDs that do not exist or are not visible to the caller
+    denied: list[uuid.UUID]
+
+
+# Outcome of one line of an NDJSON prototype import, `id` of the created
+# prototype or `error` if the line was rejected
+class PrototypeImportResult(SQLModel):
+    line: int
+    id: uuid.UUID | None = None
+    error: str | None = None
+
+
+class PrototypeImportReport(SQLModel):
+    created: int
+    failed: int
+    results: list[PrototypeImportResult]
+
+
+# Content query, a prototype matches if its content contains `contains` and
+# the JSON path `path` returns at least one item
+class PrototypeContentQuery(SQLModel):
+    contains: dict[str, Any] | None = None
+    path: str | None = Field(default=None, min_length=1, max_length=1000)
+
+    @model_validator(mode="after")
+    def _require_a_filter(self) -> Self:
+        if self.contains is None and self.path is None:
+            raise ValueError("Either contains or path is required")
+        return self
+
+
+# Properties to return in list views, without the prototype content
+class PrototypeSummary(SQLModel):
+    id: uuid.UUID
+    owner_id: uuid.UUID
+    title: str
+    description: str | None = None
+    visibility: str
+
+
+class PrototypeSummariesPublic(SQLModel):
+    data: list[PrototypeSummary]
+    count: int
+    next_cursor: str | None = None
 
 
 # Collaborator management models
@@ -155,6 +291,7 @@ class CollaboratorInfo(SQLModel):
 class CollaboratorsPublic(SQLModel):
     data: list[CollaboratorInfo]
     count: int
+    next_cursor: str | None = None
 
 
 # Generic message
@@ -166,13 +303,39 @@ class Message(SQLModel):
 class Token(SQLModel):
     access_token: str
     token_type: str = "bearer"
+    refresh_token: str | None = None
+
+
+class TokenRefresh(SQLModel):
+    refresh_token: str
 
 
-# Contents of JWT token
+# Contents of JWT token, tokens issued before refresh tokens were introduced
+# have no type and no claims besides sub
 class TokenPayload(SQLModel):
     sub: str | None = None
+    type: Literal["access", "refresh"] | None = None
+    is_active: bool | None = None
+    is_superuser: bool | None = None
+
+
+# The caller as described by the claims of their access token
+class TokenUser(SQLModel):
+    id: uuid.UUID
+    is_active: bool
+    is_superuser: bool
 
 
 class NewPassword(SQLModel):
     token: str
     new_password: str = Field(min_length=8, max_length=40)
+
+
+# Token buckets of the database login throttle backend
+class LoginThrottleBucket(SQLModel, table=True):
+    __tablename__ = "login_throttle_bucket"
+
+    key: str = Field(primary_key=True, max_length=320)
+    tokens: float
+    # Unix time of the last update, indexed for pruning idle buckets
+    updated_at: float = Field(index=True)
@@ -0,0 +1,51 @@
+import argparse
+import logging
+import sys
+
+from sqlmodel import Session
+
+from app import crud
+from app.core.db import engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def check() -> bool:
+    with Session(engine) as session:
+        missing, unexpected = crud.check_prototype_access(session=session)
+    if missing or unexpected:
+        logger.warning(
+            f"prototype_access drift: {missing} missing rows, "
+            f"{unexpected} unexpected rows"
+        )
+        return False
+    logger.info("prototype_access is in sync")
+    return True
+
+
+def rebuild() -> None:
+    with Session(engine) as session:
+        count = crud.rebuild_prototype_access(session=session)
+    logger.info(f"prototype_access rebuilt with {count} rows")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Rebuild the prototype_access table from prototype owners "
+        "and collaborators, or check it for drift."
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="only report drift, exit with status 1 if any is found",
+    )
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check() else 1)
+    rebuild()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,487 @@
+import json
+import uuid
+from collections.abc import Iterator
+from typing import Any
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import DataError
+from sqlmodel import Session
+
+from app import async_crud, crud
+from app.api.deps import STICKY_PRIMARY_COOKIE
+from app.core.config import settings
+from app.core.db import engine
+from app.crud import acl_cache, public_catalog_cache
+from app.tests.utils.utils import random_lower_string, recorded_statements
+from app.utils import encode_cursor
+
+
+def test_read_prototype_summaries(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    data = {"title": "Foo", "description": "Fighters", "content": {"commands": {}}}
+    response = client.post(
+        f"{settings.API_V1_STR}/prototypes/",
+        headers=normal_user_token_headers,
+        json=data,
+    )
+    assert response.status_code == 200
+    created = response.json()
+
+    response = client.get(
+        f"{settings.API_V1_STR}/prototypes/summaries",
+        headers=normal_user_token_headers,
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["count"] >= 1
+    summary = next(item for item in content["data"] if item["id"] == created["id"])
+    assert summary["title"] == data["title"]
+    assert summary["description"] == data["description"]
+    assert summary["visibility"] == "private"
+    assert "content" not in summary
+
+
+def test_read_prototype_summaries_invalid_limit(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    for limit in [0, settings.PAGE_MAX_LIMIT + 1]:
+        response = client.get(
+            f"{settings.API_V1_STR}/prototypes/summaries",
+            headers=normal_user_token_headers,
+            params={"limit": limit},
+        )
+        assert response.status_code == 422
+
+
+def test_read_public_prototypes(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    data = {"title": "Public", "visibility": "public", "content": {"commands": {}}}
+    response = client.post(
+        f"{settings.API_V1_STR}/prototypes/",
+        headers=normal_user_token_headers,
+        json=data,
+    )
+    created = response.json()
+
+    response = client.get(f"{settings.API_V1_STR}/prototypes/public/")
+    assert response.status_code == 200
+    catalog = response.json()
+    assert created["id"] in {item["id"] for item in catalog["data"]}
+    assert all("content" not in item for item in catalog["data"])
+
+    response = client.put(
+        f"{settings.API_V1_STR}/prototypes/{created['id']}",
+        headers=normal_user_token_headers,
+        json={"visibility": "private"},
+    )
+    assert response.status_code == 200
+
+    response = client.get(f"{settings.API_V1_STR}/prototypes/public/")
+    catalog = response.json()
+    assert created["id"] not in {item["id"] for item in catalog["data"]}
+
+
+def test_read_public_prototypes_limits_share_pages(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    for i in range(3):
+        response = client.post(
+            f"{settings.API_V1_STR}/prototypes/",
+            headers=normal_user_token_headers,
+            json={"title": f"Public {i}", "visibility": "public"},
+        )
+        assert response.status_code == 200
+
+    response = client.get(f"{settings.API_V1_STR}/prototypes/public/?limit=2")
+    assert response.status_code == 200
+    first = response.json()
+    assert len(first["data"]) == 2
+    assert first["next_cursor"] == encode_cursor(uuid.UUID(first["data"][1]["id"]))
+
+    # Served from the page cached for the first request
+    hits = public_catalog_cache.stats()["hits"]
+    response = client.get(f"{settings.API_V1_STR}/prototypes/public/?limit=1")
+    assert response.json()["data"] == first["data"][:1]
+    assert public_catalog_cache.stats()["hits"] == hits + 1
+
+    for limit in [0, settings.PAGE_MAX_LIMIT + 1]:
+        response = client.get(
+            f"{settings.API_V1_STR}/prototypes/public/", params={"limit": limit}
+        )
+        assert response.status_code == 422
+
+
+def test_search_prototypes(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    data = {
+        "title": "Cloud tooling",
+        "content": {
+            "commands": {
+                "provision": {
+                    "description": "Create machines",
+                    "alias": ["up"],
+                    "commands": {"kubernetes": {"description": "Create a cluster"}},
+                }
+            }
+        },
+    }
+    response = client.post(
+        f"{settings.API_V1_STR}/prototypes/",
+        headers=normal_user_token_headers,
+        json=data,
+    )
+    created = response.json()
+
+    for query in ("cloud", "provision", "kubernetes", "cluster"):
+        response = client.get(
+            f"{settings.API_V1_STR}/prototypes/search",
+            headers=normal_user_token_headers,
+            params={"q": query},
+        )
+        assert response.status_code == 200
+        results = response.json()
+        assert created["id"] in {item["id"] for item in results["data"]}
+
+
+def test_search_prototypes_respects_access(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    superuser_token_headers: dict[str, str],
+) -> None:
+    data = {"title": "Hiddenword prototype", "visibility": "private"}
+    client.post(
+        f"{settings.API_V1_STR}/prototypes/",
+        headers=superuser_token_headers,
+        json=data,
+    )
+
+    response = client.get(
+        f"{settings.API_V1_STR}/prototypes/search",
+        headers=normal_user_token_headers,
+        params={"q": "hiddenword"},
+    )
+    assert response.status_code == 200
+    assert response.json()["count"] == 0
+
+
+def test_search_prototype_content(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    superuser_token_headers: dict[str, str],
+) -> None:
+    command = random_lower_string()
+    content = {"commands": {"deploy": {"commands": {command: {"alias": ["x"]}}}}}
+    response = client.post(
+        f"{settings.API_V1_STR}/prototypes/",
+        headers=normal_user_token_headers,
+        json={"title": "Nested", "content": content},
+    )
+    created = response.json()
+    client.post(
+        f"{settings.API_V1_STR}/prototypes/",
+        headers=superuser_token_headers,
+        json={"title": "Private", "content": content},
+    )
+
+    query: dict[str, Any]
+    for query in (
+        {"contains": content},
+        {"contains": {"commands": {"deploy": {"commands": {command: {}}}}}},
+        {"path": f"$.**.commands.{command}"},
+        {"contains": {"commands": {"deploy": {}}}, "path": f"$.**.{command}.alias"},
+    ):
+        response = client.post(
+            f"{settings.API_V1_STR}/prototypes/search/content",
+            headers=normal_user_token_headers,
+            json=query,
+        )
+        assert response.status_code == 200
+        results = response.json()
+        assert results["count"] == 1
+        assert results["data"][0]["id"] == created["id"]
+
+    response = client.post(
+        f"{settings.API_V1_STR}/prototypes/search/content",
+        headers=normal_user_token_headers,
+        json={"path": f'$.**.commands.{command}.alias[*] ? (@ == "y")'},
+    )
+    assert response.status_code == 200
+    assert response.json()["count"] == 0
+
+
+def test_search_prototype_content_invalid(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/prototypes/search/content",
+        headers=normal_user_token_headers,
+        json={},
+    )
+    assert response.status_code == 422
+
+    response = client.post(
+        f"{settings.API_V1_STR}/prototypes/search/content",
+        headers=normal_user_token_headers,
+        json={"path": "$.commands["},
+    )
+    assert response.status_code == 400
+
+
+def test_import_prototypes(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    title = random_lower_string()
+    lines = [
+        json.dumps({"title": f"{title} 1", "content": {"commands": {}}}),
+        "",
+        "{not json",
+        json.dumps({"title": ""}),
+        json.dumps({"title": f"{title} 2", "visibility": "public"}),
+        json.dumps({"title": "x" * 200}),
+        json.dumps({"title": f"{title} 3"}),
+    ]
+
+    def body() -> Iterator[bytes]:
+        # Split mid-line to check lines spanning chunks are reassembled
+        data = "\n".join(lines).encode()
+        for i in range(0, len(data), 7):
+            yield data[i : i + 7]
+
+    with (
+        patch("app.core.config.settings.PROTOTYPE_IMPORT_BATCH_SIZE", 2),
+        patch("app.core.config.settings.PROTOTYPE_IMPORT_MAX_LINE_BYTES", 100),
+    ):
+        response = client.post(
+            f"{settings.API_V1_STR}/prototypes/import",
+            headers={
+                **normal_user_token_headers,
+                "Content-Type": "application/x-ndjson",
+            },
+            content=body(),
+        )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["created"] == 3
+    assert report["failed"] == 3
+    results = report["results"]
+    assert [result["line"] for result in results] == [1, 3, 4, 5, 6, 7]
+    assert [result["id"] is not None for result in results] == [
+        True,
+        False,
+        False,
+        True,
+        False,
+        True,
+    ]
+    assert results[2]["error"].startswith("title: ")
+    assert results[4]["error"] == "Line too long"
+
+    response = client.get(
+        f"{settings.API_V1_STR}/prototypes/{results[3]['id']}",
+        headers=normal_user_token_headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["title"] == f"{title} 2"
+    assert response.json()["visibility"] == "public"
+
+    response = client.get(
+        f"{settings.API_V1_STR}/prototypes/{results[5]['id']}",
+        headers=normal_user_token_headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["title"] == f"{title} 3"
+
+
+def test_import_prototypes_batch_failure(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    create_prototypes = async_crud.create_prototypes
+    calls = 0
+
+    async def fail_second_batch(**kwargs: Any) -> list[uuid.UUID]:
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            raise DataError("INSERT", {}, Exception("invalid byte sequence"))
+        return await create_prototypes(**kwargs)
+
+    body = "\n".join(json.dumps({"title": f"Batch {i}"}) for i in range(5))
+    with (
+        patch("app.core.config.settings.PROTOTYPE_IMPORT_BATCH_SIZE", 2),
+        patch("app.async_crud.create_prototypes", fail_second_batch),
+    ):
+        response = client.post(
+            f"{settings.API_V1_STR}/prototypes/import",
+            headers={
+                **normal_user_token_headers,
+                "Content-Type": "application/x-ndjson",
+            },
+            content=body.encode(),
+        )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["created"] == 3
+    assert report["failed"] == 2
+    assert [result["error"] is None for result in report["results"]] == [
+        True,
+        True,
+        False,
+        False,
+        True,
+    ]
+
+
+def test_import_prototypes_unsupported_media_type(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/prototypes/import",
+        headers={**normal_user_token_headers, "Content-Type": "application/json"},
+        content=b'[{"title": "Array"}]',
+    )
+    assert response.status_code == 415
+
+
+def test_batch_get_prototypes(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    superuser_token_headers: dict[str, str],
+) -> None:
+    created = []
+    for data, headers in [
+        ({"title": "Mine"}, normal_user_token_headers),
+        ({"title": "Public", "visibility": "public"}, superuser_token_headers),
+        ({"title": "Private"}, superuser_token_headers),
+    ]:
+        response = client.post(
+            f"{settings.API_V1_STR}/prototypes/", headers=headers, json=data
+        )
+        created.append(response.json()["id"])
+    mine, public, private = created
+    missing = str(uuid.uuid4())
+
+    response = client.post(
+        f"{settings.API_V1_STR}/prototypes/batch-get",
+        headers=normal_user_token_headers,
+        json={"ids": [private, public, missing, mine, public]},
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert [item["id"] for item in content["data"]] == [public, mine]
+    assert content["denied"] == [private, missing]
+
+
+def test_batch_get_prototypes_too_many_ids(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    ids = [str(uuid.uuid4()) for _ in range(settings.PROTOTYPE_BATCH_MAX_IDS + 1)]
+    response = client.post(
+        f"{settings.API_V1_STR}/prototypes/batch-get",
+        headers=normal_user_token_headers,
+        json={"ids": ids},
+    )
+    assert response.status_code == 400
+
+
+def test_update_prototype_sticks_to_primary(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/prototypes/",
+        headers=normal_user_token_headers,
+        json={"title": "Sticky"},
+    )
+    assert STICKY_PRIMARY_COOKIE in response.cookies
+    prototype_id = response.json()["id"]
+    client.cookies.clear()
+
+    response = client.get(
+        f"{settings.API_V1_STR}/prototypes/{prototype_id}",
+        headers=normal_user_token_headers,
+    )
+    assert response.status_code == 200
+    assert STICKY_PRIMARY_COOKIE not in response.cookies
+
+    response = client.put(
+        f"{settings.API_V1_STR}/prototypes/{prototype_id}",
+        headers=normal_user_token_headers,
+        json={"title": "Stuck"},
+    )
+    assert response.status_code == 200
+    assert STICKY_PRIMARY_COOKIE in client.cookies
+    client.cookies.clear()
+
+
+def test_replica_reads_do_not_fill_acl_cache(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/prototypes/",
+        headers=normal_user_token_headers,
+        json={"title": "Replica"},
+    )
+    prototype = response.json()
+    client.cookies.clear()
+    owner_id = uuid.UUID(prototype["owner_id"])
+    prototype_id = uuid.UUID(prototype["id"])
+    acl_cache.clear()
+
+    with Session(engine, info={"replica": True}) as session:
+        _, role = crud.get_prototype_with_role(
+            session=session, prototype_id=prototype_id, user_id=owner_id
+        )
+    assert role == "owner"
+    assert acl_cache.get((owner_id, prototype_id)) is None
+
+    with Session(engine) as session:
+        crud.get_prototype_with_role(
+            session=session, prototype_id=prototype_id, user_id=owner_id
+        )
+    assert acl_cache.get((owner_id, prototype_id)) == "owner"
+
+
+def test_replica_reads_do_not_fill_public_catalog_cache() -> None:
+    crud.public_catalog_cache.clear()
+    page_size = crud.public_catalog_page_size(10)
+    with Session(engine, info={"replica": True}) as session:
+        crud.get_public_prototypes(session=session, limit=10)
+    assert crud.public_catalog_cache.get((None, page_size)) is None
+
+    with Session(engine) as session:
+        crud.get_public_prototypes(session=session, limit=10)
+    assert crud.public_catalog_cache.get((None, page_size)) is not None
+
+
+def test_prototype_writes_statement_count(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    # No SELECT after the INSERT and UPDATE to reload what was written
+    with recorded_statements() as statements:
+        response = client.post(
+            f"{settings.API_V1_STR}/prototypes/",
+            headers=normal_user_token_headers,
+            json={"title": "Counted", "content": {"commands": {}}},
+        )
+    assert response.status_code == 200
+    assert [statement.split()[0] for statement in statements] == [
+        "INSERT",
+        "INSERT",
+    ]
+    prototype_id = response.json()["id"]
+
+    with recorded_statements() as statements:
+        response = client.put(
+            f"{settings.API_V1_STR}/prototypes/{prototype_id}",
+            headers=normal_user_token_headers,
+            json={"title": "Recounted"},
+        )
+    assert response.status_code == 200
+    assert response.json()["title"] == "Recounted"
+    assert [statement.split()[0] for statement in statements] == [
+        "SELECT",
+        "UPDATE",
+    ]
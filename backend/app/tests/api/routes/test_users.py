@@ -1,14 +1,25 @@
 import uuid
+from typing import Any
 from unittest.mock import patch
 
 from fastapi.testclient import TestClient
 from sqlmodel import Session, select
 
-from app import crud
+from app import async_crud, crud
+from app.api.deps import STICKY_PRIMARY_COOKIE
 from app.core.config import settings
-from app.core.security import verify_password
+from app.core.security import (
+    PasswordHashingBusyError,
+    get_password_hash,
+    verify_password,
+)
 from app.models import User, UserCreate
-from app.tests.utils.utils import random_email, random_lower_string
+from app.tests.utils.user import user_authentication_headers
+from app.tests.utils.utils import (
+    random_email,
+    random_lower_string,
+    recorded_statements,
+)
 
 
 def test_get_users_superuser_me(
@@ -56,6 +67,161 @@ def test_create_user_new_email(
         assert user.email == created_user["email"]
 
 
+def test_import_users_csv(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    emails = [random_email() for _ in range(5)]
+    password = random_lower_string()
+    body = "\r\n".join(
+        [
+            "email,password,full_name,is_superuser",
+            f'{emails[0]},{password},"Doe, Jane",',
+            f"{settings.EMAIL_TEST_USER.upper()},{password},,",
+            "",
+            f"{emails[1]},short,,",
+            f"{emails[0]},{password},,",
+            f"not-an-email,{password},,",
+            f"{emails[2]},{password},,true",
+            f'{emails[3]},{password},"Line\r',
+            'Break",',
+            f'{emails[4]},{password},"Unterminated',
+        ]
+    )
+    with (
+        patch("app.api.routes.users.send_email", return_value=None) as send_email,
+        patch("app.core.config.settings.SMTP_HOST", "smtp.example.com"),
+        patch("app.core.config.settings.SMTP_USER", "admin@example.com"),
+        patch("app.core.config.settings.USER_IMPORT_BATCH_SIZE", 2),
+    ):
+        r = client.post(
+            f"{settings.API_V1_STR}/users/import",
+            headers={**superuser_token_headers, "Content-Type": "text/csv"},
+            params={"send_welcome_emails": True},
+            content=body.encode(),
+        )
+    assert r.status_code == 200
+    report = r.json()
+    assert report["created"] == 3
+    assert report["failed"] == 5
+    errors = {result["line"]: result["error"] for result in report["results"]}
+    assert list(errors) == [2, 3, 5, 6, 7, 8, 9, 11]
+    assert errors[2] is None
+    assert errors[3] == "The user with this email already exists in the system."
+    assert errors[5].startswith("password: ")
+    assert errors[6] == "Duplicate email in this import"
+    assert errors[7].startswith("email: ")
+    assert errors[8] is None
+    assert errors[9] is None
+    assert errors[11] == "Unterminated quoted field"
+    assert {call.kwargs["email_to"] for call in send_email.call_args_list} == {
+        emails[0],
+        emails[2],
+        emails[3],
+    }
+
+    user = crud.get_user_by_email(session=db, email=emails[0])
+    assert user
+    assert user.full_name == "Doe, Jane"
+    assert not user.is_superuser
+    assert verify_password(password, user.hashed_password)
+    user = crud.get_user_by_email(session=db, email=emails[2])
+    assert user
+    assert user.is_superuser
+    assert crud.get_user_by_email(session=db, email=emails[1]) is None
+    user = crud.get_user_by_email(session=db, email=emails[3])
+    assert user
+    assert user.full_name == "Line\nBreak"
+
+
+def test_import_users_batch_failure(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    emails = [random_email() for _ in range(5)]
+    body = "\n".join(
+        ["email,password"] + [f"{email},{random_lower_string()}" for email in emails]
+    )
+    create_users = async_crud.create_users
+    calls = 0
+
+    async def fail_second_batch(**kwargs: Any) -> list[uuid.UUID]:
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            raise PasswordHashingBusyError()
+        return await create_users(**kwargs)
+
+    with (
+        patch("app.core.config.settings.USER_IMPORT_BATCH_SIZE", 2),
+        patch("app.async_crud.create_users", fail_second_batch),
+    ):
+        r = client.post(
+            f"{settings.API_V1_STR}/users/import",
+            headers={**superuser_token_headers, "Content-Type": "text/csv"},
+            content=body.encode(),
+        )
+    assert r.status_code == 200
+    report = r.json()
+    assert report["created"] == 3
+    assert report["failed"] == 2
+    results = report["results"]
+    assert [result["line"] for result in results] == [2, 3, 4, 5, 6]
+    assert [result["error"] is None for result in results] == [
+        True,
+        True,
+        False,
+        False,
+        True,
+    ]
+    assert crud.get_user_by_email(session=db, email=emails[2]) is None
+    assert crud.get_user_by_email(session=db, email=emails[4])
+
+
+def test_import_users_ndjson(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    email = random_email()
+    body = f'{{"email": "{email}", "password": "{random_lower_string()}"}}\n{{'
+    with patch("app.api.routes.users.send_email", return_value=None) as send_email:
+        r = client.post(
+            f"{settings.API_V1_STR}/users/import",
+            headers={**superuser_token_headers, "Content-Type": "application/x-ndjson"},
+            content=body.encode(),
+        )
+    assert r.status_code == 200
+    report = r.json()
+    assert report["created"] == 1
+    assert report["failed"] == 1
+    assert report["results"][0]["line"] == 1
+    assert report["results"][1]["line"] == 2
+    assert report["results"][1]["error"]
+    assert not send_email.called
+    user = crud.get_user_by_email(session=db, email=email)
+    assert user
+    assert str(user.id) == report["results"][0]["id"]
+
+
+def test_import_users_unsupported_media_type(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/users/import",
+        headers={**superuser_token_headers, "Content-Type": "application/json"},
+        content=b"[]",
+    )
+    assert r.status_code == 415
+
+
+def test_import_users_normal_user(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/users/import",
+        headers={**normal_user_token_headers, "Content-Type": "text/csv"},
+        content=b"email,password\n",
+    )
+    assert r.status_code == 403
+
+
 def test_get_existing_user(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -168,6 +334,66 @@ def test_retrieve_users(
         assert "email" in item
 
 
+def test_retrieve_users_invalid_page(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    for params in [
+        {"limit": 0},
+        {"limit": -1},
+        {"limit": settings.PAGE_MAX_LIMIT + 1},
+        {"skip": -1},
+    ]:
+        r = client.get(
+            f"{settings.API_V1_STR}/users/",
+            headers=superuser_token_headers,
+            params=params,
+        )
+        assert r.status_code == 422, params
+
+
+def test_retrieve_users_with_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    for _ in range(3):
+        user_in = UserCreate(email=random_email(), password=random_lower_string())
+        crud.create_user(session=db, user_create=user_in)
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"limit": 2},
+    )
+    first_page = r.json()
+    assert len(first_page["data"]) == 2
+    assert first_page["next_cursor"]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"limit": 2, "cursor": first_page["next_cursor"]},
+    )
+    second_page = r.json()
+    assert r.status_code == 200
+    assert second_page["count"] == first_page["count"]
+    first_ids = {user["id"] for user in first_page["data"]}
+    second_ids = {user["id"] for user in second_page["data"]}
+    assert second_ids
+    assert not first_ids & second_ids
+    assert max(first_ids) < min(second_ids)
+
+
+def test_retrieve_users_invalid_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"cursor": "not-a-cursor"},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Invalid cursor"
+
+
 def test_update_user_me(
     client: TestClient, normal_user_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -191,6 +417,32 @@ def test_update_user_me(
     assert user_db.full_name == full_name
 
 
+def test_user_writes_statement_count(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    normal_user_token_headers: dict[str, str],
+) -> None:
+    # No SELECT after the INSERT and UPDATE to reload what was written
+    data = {"email": random_email(), "password": random_lower_string()}
+    with recorded_statements() as statements:
+        r = client.post(
+            f"{settings.API_V1_STR}/users/", headers=superuser_token_headers, json=data
+        )
+    assert r.status_code == 200
+    assert [statement.split()[0] for statement in statements] == ["SELECT", "INSERT"]
+
+    crud.user_cache.clear()
+    with recorded_statements() as statements:
+        r = client.patch(
+            f"{settings.API_V1_STR}/users/me",
+            headers=normal_user_token_headers,
+            json={"full_name": "Counted Name"},
+        )
+    assert r.status_code == 200
+    assert r.json()["full_name"] == "Counted Name"
+    assert [statement.split()[0] for statement in statements] == ["SELECT", "UPDATE"]
+
+
 def test_update_password_me(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -245,6 +497,33 @@ def test_update_password_me_incorrect_password(
     assert updated_user["detail"] == "Incorrect password"
 
 
+def test_update_password_me_stale_cached_user(client: TestClient, db: Session) -> None:
+    email = random_email()
+    old_password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=email, password=old_password)
+    )
+    headers = user_authentication_headers(
+        client=client, email=email, password=old_password
+    )
+    # Cache the user, then change its password as another worker would,
+    # without invalidating this worker's cache
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 200
+    assert crud.user_cache.get(user.id) is not None
+    user.hashed_password = get_password_hash(random_lower_string())
+    db.add(user)
+    db.commit()
+
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/me/password",
+        headers=headers,
+        json={"current_password": old_password, "new_password": "a new password"},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Incorrect password"
+
+
 def test_update_user_me_email_exists(
     client: TestClient, normal_user_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -292,6 +571,7 @@ def test_register_user(client: TestClient, db: Session) -> None:
         json=data,
     )
     assert r.status_code == 200
+    assert STICKY_PRIMARY_COOKIE in r.cookies
     created_user = r.json()
     assert created_user["email"] == username
     assert created_user["full_name"] == full_name
@@ -412,6 +692,11 @@ def test_delete_user_me(client: TestClient, db: Session) -> None:
     user_db = db.execute(user_query).first()
     assert user_db is None
 
+    # The access token is still valid, its user is gone
+    r = client.delete(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 404
+    assert r.json()["detail"] == "User not found"
+
 
 def test_delete_user_me_as_superuser(
     client: TestClient, superuser_token_headers: dict[str, str]
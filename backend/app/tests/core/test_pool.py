@@ -0,0 +1,27 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError
+
+from app.core.pool import TimedQueuePool
+
+
+def test_timed_queue_pool_stats(tmp_path) -> None:  # type: ignore[no-untyped-def]
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    pool = engine.pool
+    with engine.connect():
+        stats = pool.stats()  # type: ignore[attr-defined]
+        assert stats["checked_out"] == 1
+        assert stats["checkouts"] == 1
+        with pytest.raises(TimeoutError):
+            engine.connect()
+    stats = pool.stats()  # type: ignore[attr-defined]
+    assert stats["checked_out"] == 0
+    assert stats["timeouts"] == 1
+    assert stats["max_wait_seconds"] >= 0.05
+    engine.dispose()
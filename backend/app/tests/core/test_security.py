@@ -0,0 +1,70 @@
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+from jwt.exceptions import ExpiredSignatureError
+
+from app.core.security import (
+    PasswordHasher,
+    PasswordHashingBusyError,
+    create_access_token,
+    decode_token,
+    token_cache,
+)
+
+
+def test_password_hasher_rejects_when_full() -> None:
+    hasher = PasswordHasher(workers=1, max_pending=0)
+    try:
+        assert hasher.run(pow, 2, 3) == 8
+
+        busy = threading.Thread(target=hasher.run, args=(time.sleep, 1))
+        busy.start()
+        while hasher.stats()["in_flight"] == 0:
+            time.sleep(0.01)
+        with pytest.raises(PasswordHashingBusyError):
+            hasher.run(pow, 2, 3)
+        busy.join()
+
+        stats = hasher.stats()
+        assert stats["rejected"] == 1
+        assert stats["completed"] == 2
+        assert stats["in_flight"] == 0
+    finally:
+        hasher.shutdown()
+
+
+def test_password_hasher_inline() -> None:
+    hasher = PasswordHasher(workers=0, max_pending=0)
+    assert hasher.run(pow, 2, 3) == 8
+    assert hasher.map(abs, [-1, 2, -3]) == [1, 2, 3]
+
+
+def test_password_hasher_map() -> None:
+    hasher = PasswordHasher(workers=2, max_pending=0)
+    try:
+        assert hasher.map(abs, range(-50, 50)) == [abs(i) for i in range(-50, 50)]
+        assert hasher.map(abs, []) == []
+        stats = hasher.stats()
+        assert stats["completed"] == 2
+        assert stats["in_flight"] == 0
+    finally:
+        hasher.shutdown()
+
+
+def test_decode_token_cached() -> None:
+    token = create_access_token("subject", expires_delta=timedelta(minutes=5))
+    assert decode_token(token).sub == "subject"
+
+    hits = token_cache.hits
+    assert decode_token(token).sub == "subject"
+    assert token_cache.hits == hits + 1
+
+
+def test_decode_token_expired() -> None:
+    token = create_access_token("subject", expires_delta=timedelta(minutes=-1))
+    with pytest.raises(ExpiredSignatureError):
+        decode_token(token)
+    with pytest.raises(ExpiredSignatureError):
+        decode_token(token)
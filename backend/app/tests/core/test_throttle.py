@@ -0,0 +1,96 @@
+import time
+import uuid
+from unittest.mock import patch
+
+from sqlmodel import Session, col, delete, select
+
+from app.core.db import engine
+from app.core.throttle import (
+    DatabaseThrottleBackend,
+    LoginThrottle,
+    MemoryThrottleBackend,
+)
+from app.models import LoginThrottleBucket
+
+
+def test_memory_throttle_backend() -> None:
+    backend = MemoryThrottleBackend(maxsize=10)
+    assert backend.take("key", capacity=2, rate=1) == 0
+    assert backend.take("key", capacity=2, rate=1) == 0
+    assert 0 < backend.take("key", capacity=2, rate=1) <= 1
+    assert backend.take("other", capacity=2, rate=1) == 0
+    backend.refund("key", capacity=2, rate=1)
+    assert backend.take("key", capacity=2, rate=1) == 0
+
+
+def test_memory_throttle_backend_refund_capped() -> None:
+    backend = MemoryThrottleBackend(maxsize=10)
+    backend.refund("key", capacity=1, rate=0.001)
+    assert backend.take("key", capacity=1, rate=0.001) == 0
+    backend.refund("key", capacity=1, rate=0.001)
+    backend.refund("key", capacity=1, rate=0.001)
+    assert backend.take("key", capacity=1, rate=0.001) == 0
+    assert backend.take("key", capacity=1, rate=0.001) > 0
+
+
+def test_memory_throttle_backend_bounded() -> None:
+    backend = MemoryThrottleBackend(maxsize=1)
+    backend.take("first", capacity=1, rate=0.001)
+    assert backend.take("first", capacity=1, rate=0.001) > 0
+    backend.take("second", capacity=1, rate=0.001)
+    assert backend.take("first", capacity=1, rate=0.001) == 0
+
+
+def test_database_throttle_backend_prunes_idle_buckets() -> None:
+    backend = DatabaseThrottleBackend(engine, idle_seconds=60)
+    idle, recent = f"test:{uuid.uuid4()}", f"test:{uuid.uuid4()}"
+    now = time.time()
+    with Session(engine) as session:
+        session.add(LoginThrottleBucket(key=idle, tokens=0, updated_at=now - 61))
+        session.add(LoginThrottleBucket(key=recent, tokens=0, updated_at=now))
+        session.commit()
+
+    assert backend.prune() >= 1
+    with Session(engine) as session:
+        keys = session.exec(
+            select(LoginThrottleBucket.key).where(
+                col(LoginThrottleBucket.key).in_([idle, recent])
+            )
+        ).all()
+        assert keys == [recent]
+        session.connection().execute(
+            delete(LoginThrottleBucket).where(col(LoginThrottleBucket.key) == recent)
+        )
+        session.commit()
+
+
+def test_login_throttle_reserves_before_checking() -> None:
+    throttle = LoginThrottle(MemoryThrottleBackend(maxsize=10))
+    with patch("app.core.config.settings.LOGIN_THROTTLE_ACCOUNT_CAPACITY", 2):
+        # Concurrent attempts hold their tokens until they complete
+        assert throttle.acquire(ip="1.2.3.4", email="a@example.com") == 0
+        assert throttle.acquire(ip="1.2.3.4", email="A@example.com") == 0
+        assert throttle.acquire(ip="1.2.3.4", email="a@example.com") > 0
+        throttle.release(ip="1.2.3.4", email="a@example.com")
+        assert throttle.acquire(ip="1.2.3.4", email="a@example.com") == 0
+    assert throttle.stats()["failures"] == 2
+    assert throttle.stats()["rejected"] == 1
+
+
+def test_login_throttle_per_ip() -> None:
+    throttle = LoginThrottle(MemoryThrottleBackend(maxsize=10))
+    with (
+        patch("app.core.config.settings.LOGIN_THROTTLE_IP_CAPACITY", 1),
+        patch("app.core.config.settings.LOGIN_THROTTLE_PER_IP", False),
+    ):
+        assert throttle.acquire(ip="1.2.3.4", email="a@example.com") == 0
+        assert throttle.acquire(ip="1.2.3.4", email="b@example.com") == 0
+    with (
+        patch("app.core.config.settings.LOGIN_THROTTLE_ACCOUNT_CAPACITY", 1),
+        patch("app.core.config.settings.LOGIN_THROTTLE_IP_CAPACITY", 1),
+        patch("app.core.config.settings.LOGIN_THROTTLE_PER_IP", True),
+    ):
+        assert throttle.acquire(ip="5.6.7.8", email="c@example.com") == 0
+        assert throttle.acquire(ip="5.6.7.8", email="d@example.com") > 0
+        # The rejected attempt gave back the account token it had taken
+        assert throttle.acquire(ip="9.9.9.9", email="d@example.com") == 0
@@ -0,0 +1,256 @@
+"""
+Query plan regression tests for the crud queries, run against a seeded
+dataset. Sequential scans are disabled for each check, so Postgres only falls
+back to one when no index can serve the query.
+"""
+
+import random
+import uuid
+from collections.abc import Callable, Generator, Iterator
+from typing import Any
+
+import pytest
+from sqlalchemy import event, text
+from sqlmodel import Session, col, delete, insert
+
+from app import crud
+from app.core.db import engine
+from app.models import Prototype, PrototypeCollaborator, User
+
+USERS = 200
+PROTOTYPES_PER_USER = 20
+COLLABORATORS_PER_PROTOTYPE = 2
+
+
+@pytest.fixture(scope="module")
+def dataset() -> Generator[list[uuid.UUID], None, None]:
+    rng = random.Random(20)
+    user_ids = [uuid.uuid4() for _ in range(USERS)]
+    users = [
+        {
+            "id": user_id,
+            "email": f"Plan.User{i}@Example.com",
+            "hashed_password": "not a hash",
+            "is_active": True,
+            "is_superuser": False,
+        }
+        for i, user_id in enumerate(user_ids)
+    ]
+    prototypes: list[dict[str, Any]] = [
+        {
+            "id": uuid.uuid4(),
+            "title": f"Prototype {i}",
+            "content": {},
+            "visibility": "public" if rng.random() < 0.1 else "private",
+            "owner_id": owner_id,
+        }
+        for owner_id in user_ids
+        for i in range(PROTOTYPES_PER_USER)
+    ]
+    collaborators = [
+        {"prototype_id": prototype["id"], "user_id": user_id, "role": "viewer"}
+        for prototype in prototypes
+        for user_id in rng.sample(
+            [id for id in user_ids if id != prototype["owner_id"]],
+            COLLABORATORS_PER_PROTOTYPE,
+        )
+    ]
+    with Session(engine) as session:
+        connection = session.connection()
+        connection.execute(insert(User).values(users))
+        connection.execute(insert(Prototype).values(prototypes))
+        connection.execute(insert(PrototypeCollaborator).values(collaborators))
+        crud.rebuild_prototype_access(session=session)
+        connection.execute(text("ANALYZE"))
+        session.commit()
+
+    yield user_ids
+
+    with Session(engine) as session:
+        prototype_ids = [prototype["id"] for prototype in prototypes]
+        connection = session.connection()
+        connection.execute(
+            delete(PrototypeCollaborator).where(
+                col(PrototypeCollaborator.prototype_id).in_(prototype_ids)
+            )
+        )
+        connection.execute(
+            delete(Prototype).where(col(Prototype.owner_id).in_(user_ids))
+        )
+        connection.execute(delete(User).where(col(User.id).in_(user_ids)))
+        session.commit()
+
+
+def _nodes(plan: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _nodes(child)
+
+
+def assert_uses_indexes(call: Callable[[Session], Any], *indexes: str) -> None:
+    """
+    Run `call`, EXPLAIN every statement it executed and check that none of
+    them scans a table sequentially and that `indexes` are used.
+    """
+    with Session(engine) as session:
+        connection = session.connection()
+        connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        statements: list[tuple[str, Any]] = []
+
+        def capture(*args: Any) -> None:
+            statements.append((args[2], args[3]))
+
+        event.listen(connection, "before_cursor_execute", capture)
+        try:
+            call(session)
+        finally:
+            event.remove(connection, "before_cursor_execute", capture)
+        assert statements
+
+        used: set[str] = set()
+        for statement, parameters in statements:
+            plan = connection.exec_driver_sql(
+                f"EXPLAIN (FORMAT JSON) {statement}", parameters
+            ).scalar_one()
+            nodes = list(_nodes(plan[0]["Plan"]))
+            seq_scans = [
+                node["Relation Name"]
+                for node in nodes
+                if node["Node Type"] == "Seq Scan"
+            ]
+            assert not seq_scans, f"Sequential scan on {seq_scans}: {statement}"
+            used |= {node["Index Name"] for node in nodes if "Index Name" in node}
+        assert set(indexes) <= used, used
+
+
+@pytest.mark.usefixtures("dataset")
+def test_get_user_by_email_plan() -> None:
+    assert_uses_indexes(
+        lambda s: crud.get_user_by_email(session=s, email="plan.user7@example.com"),
+        "ix_user_email_lower",
+    )
+
+
+@pytest.mark.usefixtures("dataset")
+def test_get_existing_emails_plan() -> None:
+    assert_uses_indexes(
+        lambda s: crud.get_existing_emails(
+            session=s, emails=["PLAN.USER7@example.com", "missing@example.com"]
+        ),
+        "ix_user_email_lower",
+    )
+
+
+def test_list_users_plan(dataset: list[uuid.UUID]) -> None:
+    assert_uses_indexes(
+        lambda s: crud.list_users(session=s, skip=20, limit=10), "user_pkey"
+    )
+    assert_uses_indexes(
+        lambda s: crud.list_users(session=s, after=min(dataset), limit=10),
+        "user_pkey",
+    )
+    assert_uses_indexes(lambda s: crud.count_users(session=s))
+
+
+def test_get_user_by_id_plan(dataset: list[uuid.UUID]) -> None:
+    assert_uses_indexes(
+        lambda s: crud.get_user_by_id(session=s, user_id=dataset[0]), "user_pkey"
+    )
+
+
+def test_get_prototype_with_role_plan(dataset: list[uuid.UUID]) -> None:
+    with Session(engine) as session:
+        prototype = crud.get_user_prototypes(
+            session=session, user_id=dataset[0], limit=1
+        )[0][0]
+    assert_uses_indexes(
+        lambda s: crud.get_prototype_with_role(
+            session=s, prototype_id=prototype.id, user_id=dataset[1]
+        ),
+        "prototype_pkey",
+        "prototype_access_pkey",
+    )
+
+
+def test_get_user_prototypes_plan(dataset: list[uuid.UUID]) -> None:
+    assert_uses_indexes(
+        lambda s: crud.get_user_prototypes(session=s, user_id=dataset[0], limit=10),
+        "prototype_access_pkey",
+    )
+    assert_uses_indexes(
+        lambda s: crud.get_user_prototypes(
+            session=s, user_id=dataset[0], after=uuid.UUID(int=0), limit=10
+        ),
+        "prototype_access_pkey",
+    )
+
+
+@pytest.mark.usefixtures("dataset")
+def test_get_public_prototypes_plan() -> None:
+    assert_uses_indexes(
+        lambda s: crud.get_public_prototypes_page(
+            session=s, limit=10, after=uuid.UUID(int=0)
+        ),
+        "ix_prototype_public_id",
+    )
+    assert_uses_indexes(
+        lambda s: crud.count_public_prototypes(session=s), "ix_prototype_public_id"
+    )
+
+
+def test_get_prototypes_by_ids_plan(dataset: list[uuid.UUID]) -> None:
+    with Session(engine) as session:
+        prototypes, _ = crud.get_user_prototypes(
+            session=session, user_id=dataset[0], limit=5
+        )
+    assert_uses_indexes(
+        lambda s: crud.get_prototypes_by_ids(
+            session=s,
+            prototype_ids=[prototype.id for prototype in prototypes],
+            user_id=dataset[1],
+        ),
+        "prototype_pkey",
+    )
+
+
+def test_collaborator_queries_plan(dataset: list[uuid.UUID]) -> None:
+    with Session(engine) as session:
+        prototype = crud.get_user_prototypes(
+            session=session, user_id=dataset[0], limit=1
+        )[0][0]
+    assert_uses_indexes(
+        lambda s: crud.get_prototype_collaborators(
+            session=s, prototype_id=prototype.id, limit=10
+        ),
+        "prototype_collaborator_pkey",
+    )
+    assert_uses_indexes(
+        lambda s: crud.is_prototype_collaborator(
+            session=s, prototype_id=prototype.id, user_id=dataset[1]
+        ),
+        "prototype_collaborator_pkey",
+    )
+
+
+def test_search_prototype_content_plan(dataset: list[uuid.UUID]) -> None:
+    assert_uses_indexes(
+        lambda s: crud.search_prototype_content(
+            session=s, user_id=dataset[0], contains={"commands": {"deploy": {}}}
+        ),
+        "ix_prototype_content",
+    )
+    assert_uses_indexes(
+        lambda s: crud.search_prototype_content(
+            session=s, user_id=dataset[0], path="$.commands.deploy"
+        ),
+        "ix_prototype_content",
+    )
+
+
+def test_search_prototypes_plan(dataset: list[uuid.UUID]) -> None:
+    assert_uses_indexes(
+        lambda s: crud.search_prototypes(
+            session=s, user_id=dataset[0], query="prototype 7"
+        ),
+        "ix_prototype_search_vector",
+    )
@@ -1,10 +1,28 @@
+import pytest
 from fastapi.encoders import jsonable_encoder
-from sqlmodel import Session
+from passlib.context import CryptContext
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, col, select
 
 from app import crud
-from app.core.security import verify_password
-from app.models import User, UserCreate, UserUpdate
-from app.tests.utils.utils import random_email, random_lower_string
+from app.core.security import pwd_context, verify_password
+from app.models import (
+    CollaboratorRole,
+    Prototype,
+    PrototypeAccess,
+    PrototypeCollaborator,
+    PrototypeCreate,
+    User,
+    UserCreate,
+    UserUpdate,
+)
+from app.tests.utils.prototype import create_random_prototype
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import (
+    random_email,
+    random_lower_string,
+    recorded_statements,
+)
 
 
 def test_create_user(db: Session) -> None:
@@ -26,6 +44,48 @@ def test_authenticate_user(db: Session) -> None:
     assert user.email == authenticated_user.email
 
 
+def test_authenticate_user_rehashes_outdated_hash(db: Session) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=email, password=password)
+    user = crud.create_user(session=db, user_create=user_in)
+    outdated_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash(password)
+    user.hashed_password = outdated_hash
+    db.add(user)
+    db.commit()
+
+    authenticated_user = crud.authenticate(session=db, email=email, password=password)
+    assert authenticated_user
+    assert authenticated_user.hashed_password != outdated_hash
+    assert not pwd_context.needs_update(authenticated_user.hashed_password)
+    assert verify_password(password, authenticated_user.hashed_password)
+
+
+def test_authenticate_user_email_case_insensitive(db: Session) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=email, password=password)
+    user = crud.create_user(session=db, user_create=user_in)
+    authenticated_user = crud.authenticate(
+        session=db, email=email.upper(), password=password
+    )
+    assert authenticated_user
+    assert authenticated_user.id == user.id
+
+
+def test_create_user_email_case_variant_rejected(db: Session) -> None:
+    email = random_email()
+    crud.create_user(
+        session=db, user_create=UserCreate(email=email, password="changethis")
+    )
+    with pytest.raises(IntegrityError):
+        crud.create_user(
+            session=db,
+            user_create=UserCreate(email=email.upper(), password="changethis"),
+        )
+    db.rollback()
+
+
 def test_not_authenticate_user(db: Session) -> None:
     email = random_email()
     password = random_lower_string()
@@ -89,3 +149,76 @@ def test_update_user(db: Session) -> None:
     assert user_2
     assert user.email == user_2.email
     assert verify_password(new_password, user_2.hashed_password)
+
+
+def test_get_user_for_auth_cached(db: Session) -> None:
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    user = crud.create_user(session=db, user_create=user_in)
+    user_2 = crud.get_user_for_auth(session=db, user_id=user.id)
+    assert user_2 and user_2.is_active
+    cached = crud.user_cache.get(user.id)
+    assert cached and cached.keys() == crud.USER_CACHE_FIELDS
+
+    db.expunge_all()
+    hits = crud.user_cache.hits
+    user_3 = crud.get_user_for_auth(session=db, user_id=user.id)
+    assert crud.user_cache.hits == hits + 1
+    assert user_3 and user_3.email == user.email
+    # Not cached, loaded from the session
+    assert verify_password(user_in.password, user_3.hashed_password)
+
+    crud.update_user(session=db, db_user=user_3, user_in=UserUpdate(is_active=False))
+    db.expunge_all()
+    user_4 = crud.get_user_for_auth(session=db, user_id=user.id)
+    assert user_4 and not user_4.is_active
+
+
+def test_delete_user_cascades(db: Session) -> None:
+    user = create_random_user(db)
+    collaborator = create_random_user(db)
+    owned = [
+        crud.create_prototype(
+            session=db,
+            prototype_in=PrototypeCreate(title=random_lower_string()),
+            owner_id=user.id,
+        )
+        for _ in range(3)
+    ]
+    for prototype in owned:
+        crud.add_collaborator(
+            session=db,
+            prototype_id=prototype.id,
+            user_id=collaborator.id,
+            role=CollaboratorRole.EDITOR,
+        )
+    shared = create_random_prototype(db)
+    crud.add_collaborator(
+        session=db,
+        prototype_id=shared.id,
+        user_id=user.id,
+        role=CollaboratorRole.VIEWER,
+    )
+    user_id, shared_id = user.id, shared.id
+    owned_ids = [prototype.id for prototype in owned]
+    db.expunge_all()
+
+    with recorded_statements() as statements:
+        assert crud.delete_user(session=db, user_id=user_id)
+    assert len(statements) == 2
+
+    assert db.get(User, user_id) is None
+    assert not db.exec(select(Prototype).where(col(Prototype.id).in_(owned_ids))).all()
+    assert not db.exec(
+        select(PrototypeCollaborator).where(
+            col(PrototypeCollaborator.prototype_id).in_(owned_ids)
+            | (col(PrototypeCollaborator.user_id) == user_id)
+        )
+    ).all()
+    assert not db.exec(
+        select(PrototypeAccess).where(
+            col(PrototypeAccess.prototype_id).in_(owned_ids)
+            | (col(PrototypeAccess.user_id) == user_id)
+        )
+    ).all()
+    assert db.get(Prototype, shared_id)
+    assert not crud.delete_user(session=db, user_id=user_id)
@@ -0,0 +1,20 @@
+from sqlmodel import Session
+
+from app import crud
+from app.models import Prototype, PrototypeCreate
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import random_lower_string
+
+
+def create_random_prototype(db: Session, visibility: str = "private") -> Prototype:
+    user = create_random_user(db)
+    owner_id = user.id
+    assert owner_id is not None
+    title = random_lower_string()
+    description = random_lower_string()
+    prototype_in = PrototypeCreate(
+        title=title, description=description, visibility=visibility
+    )
+    return crud.create_prototype(
+        session=db, prototype_in=prototype_in, owner_id=owner_id
+    )
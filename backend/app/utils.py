@@ -1,4 +1,8 @@
+import base64
+import binascii
 import logging
+import uuid
+from collections.abc import AsyncIterator
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
@@ -8,6 +12,7 @@ import emails  # type: ignore
 import jwt
 from jinja2 import Template
 from jwt.exceptions import InvalidTokenError
+from pydantic import ValidationError
 
 from app.core import security
 from app.core.config import settings
@@ -121,3 +126,61 @@ def verify_password_reset_token(token: str) -> str | None:
         return str(decoded_token["sub"])
     except InvalidTokenError:
         return None
+
+
+def encode_cursor(key: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(key.bytes).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> uuid.UUID | None:
+    try:
+        return uuid.UUID(
+            bytes=base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        )
+    except (binascii.Error, ValueError):
+        return None
+
+
+async def iter_lines(
+    chunks: AsyncIterator[bytes], *, max_line_bytes: int
+) -> AsyncIterator[bytes | None]:
+    """
+    Split a byte stream into lines, without their trailing newline. Lines
+    longer than `max_line_bytes` are dropped as they arrive and yielded as
+    None, so memory stays bounded whatever the input.
+    """
+    buffer = bytearray()
+    skipping = False
+    async for chunk in chunks:
+        start = 0
+        while (end := chunk.find(b"\n", start)) != -1:
+            if not skipping:
+                buffer += chunk[start:end]
+            if skipping or len(buffer) > max_line_bytes:
+                yield None
+            else:
+                yield bytes(buffer)
+            buffer.clear()
+            skipping = False
+            start = end + 1
+        if not skipping:
+            buffer += chunk[start:]
+            if len(buffer) > max_line_bytes:
+                buffer.clear()
+                skipping = True
+    if skipping:
+        yield None
+    elif buffer:
+        yield bytes(buffer)
+
+
+def validation_error_message(exc: ValidationError) -> str:
+    """
+    Summarize a validation error on one line, as `field: message` pairs.
+    """
+    return "; ".join(
+        ".".join(str(loc) for loc in error["loc"]) + f": {error['msg']}"
+        if error["loc"]
+        else error["msg"]
+        for error in exc.errors()
+    )
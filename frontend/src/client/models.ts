@@ -71,6 +71,11 @@ export type PrototypesPublic = {
 export type Token = {
   access_token: string
   token_type?: string
+  refresh_token?: string | null
+}
+
+export type TokenRefresh = {
+  refresh_token: string
 }
 
 export type UpdatePassword = {
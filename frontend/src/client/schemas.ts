@@ -294,6 +294,26 @@ export const $Token = {
       type: "string",
       default: "bearer",
     },
+    refresh_token: {
+      type: "any-of",
+      contains: [
+        {
+          type: "string",
+        },
+        {
+          type: "null",
+        },
+      ],
+    },
+  },
+} as const
+
+export const $TokenRefresh = {
+  properties: {
+    refresh_token: {
+      type: "string",
+      isRequired: true,
+    },
   },
 } as const
 
@@ -7,6 +7,7 @@ import type {
   Message,
   NewPassword,
   Token,
+  TokenRefresh,
   UserPublic,
   UpdatePassword,
   UserCreate,
@@ -27,6 +28,9 @@ import type {
 export type TDataLoginAccessToken = {
   formData: Body_login_login_access_token
 }
+export type TDataRefreshToken = {
+  requestBody: TokenRefresh
+}
 export type TDataRecoverPassword = {
   email: string
 }
@@ -59,6 +63,27 @@ export class LoginService {
     })
   }
 
+  /**
+   * Refresh Token
+   * Exchange a refresh token for a new access token and refresh token
+   * @returns Token Successful Response
+   * @throws ApiError
+   */
+  public static refreshToken(
+    data: TDataRefreshToken,
+  ): CancelablePromise<Token> {
+    const { requestBody } = data
+    return __request(OpenAPI, {
+      method: "POST",
+      url: "/api/v1/login/refresh-token",
+      body: requestBody,
+      mediaType: "application/json",
+      errors: {
+        422: `Validation Error`,
+      },
+    })
+  }
+
   /**
    * Test Token
    * Test access token
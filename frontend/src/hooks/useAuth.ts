@@ -5,28 +5,87 @@ import { useState } from "react"
 import { AxiosError } from "axios"
 import {
     type Body_login_login_access_token as AccessToken,
-    type ApiError,
+    ApiError,
     LoginService,
+    type Token,
     type UserPublic,
     type UserRegister,
     UsersService,
 } from "../client"
+import type { ApiRequestOptions } from "../client/core/ApiRequestOptions"
 import useCustomToast from "./useCustomToast"
 
-const isTokenExpired = (token: string): boolean => {
+// Access tokens are short-lived, refresh them this long before they expire
+const REFRESH_MARGIN_SECONDS = 60
+
+const isTokenExpired = (token: string, marginSeconds = 0): boolean => {
     try {
         const payload = JSON.parse(atob(token.split(".")[1]))
         const expirationTime = payload.exp * 1000 // Convert to milliseconds
-        return Date.now() >= expirationTime
+        return Date.now() >= expirationTime - marginSeconds * 1000
     } catch {
         return true // If token can't be decoded, consider it expired
     }
 }
 
+const storeTokens = (token: Token) => {
+    localStorage.setItem("access_token", token.access_token)
+    if (token.refresh_token) {
+        localStorage.setItem("refresh_token", token.refresh_token)
+    }
+}
+
+const clearTokens = () => {
+    localStorage.removeItem("access_token")
+    localStorage.removeItem("refresh_token")
+}
+
 const isLoggedIn = () => {
     const token = localStorage.getItem("access_token")
-    if (!token) return false
-    return !isTokenExpired(token)
+    if (token && !isTokenExpired(token)) return true
+    const refreshToken = localStorage.getItem("refresh_token")
+    return !!refreshToken && !isTokenExpired(refreshToken)
+}
+
+let refreshing: Promise<string> | null = null
+
+const refreshAccessToken = async (refreshToken: string) => {
+    try {
+        const response = await LoginService.refreshToken({
+            requestBody: { refresh_token: refreshToken },
+        })
+        storeTokens(response)
+        return response.access_token
+    } catch (err) {
+        // Rejected refresh tokens end the session, network errors don't
+        if (err instanceof ApiError) {
+            clearTokens()
+            return ""
+        }
+        return localStorage.getItem("access_token") || ""
+    }
+}
+
+// Token resolver for the API client, exchanges the refresh token for a new
+// pair shortly before the access token expires. Concurrent requests share
+// one refresh.
+const getAccessToken = async (options: ApiRequestOptions) => {
+    // The refresh request is authorized by the refresh token in its body
+    if (options.url === "/api/v1/login/refresh-token") return ""
+    const token = localStorage.getItem("access_token") || ""
+    const refreshToken = localStorage.getItem("refresh_token")
+    if (
+        !refreshToken ||
+        (token && !isTokenExpired(token, REFRESH_MARGIN_SECONDS))
+    ) {
+        return token
+    }
+    if (!refreshing) {
+        refreshing = refreshAccessToken(refreshToken).finally(() => {
+            refreshing = null
+        })
+    }
+    return refreshing
 }
 
 const useAuth = () => {
@@ -70,7 +129,7 @@ const useAuth = () => {
         const response = await LoginService.loginAccessToken({
             formData: data,
         })
-        localStorage.setItem("access_token", response.access_token)
+        storeTokens(response)
     }
 
     const loginMutation = useMutation({
@@ -94,7 +153,7 @@ const useAuth = () => {
     })
 
     const logout = () => {
-        localStorage.removeItem("access_token")
+        clearTokens()
         navigate({ to: "/login" })
     }
 
@@ -109,5 +168,5 @@ const useAuth = () => {
     }
 }
 
-export { isLoggedIn }
+export { getAccessToken, isLoggedIn }
 export default useAuth
@@ -6,12 +6,14 @@ import { routeTree } from "./routeTree.gen"
 
 import { StrictMode } from "react"
 import { OpenAPI } from "./client"
+import { getAccessToken } from "./hooks/useAuth"
 import theme from "./theme"
 
 OpenAPI.BASE = import.meta.env.VITE_API_URL
-OpenAPI.TOKEN = async () => {
-  return localStorage.getItem("access_token") || ""
-}
+OpenAPI.TOKEN = getAccessToken
+// Send the API's cookies, it keeps a client's reads on the primary database
+// for a few seconds after each of its writes
+OpenAPI.WITH_CREDENTIALS = true
 
 const queryClient = new QueryClient()
 